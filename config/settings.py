@@ -24,6 +24,66 @@ SECRET_KEY = 'django-insecure-4e9z-nkpmzgpw+$3eca%wmn2lpo#xi@!&l0dkaza!ef_m4sb_e
 TELEGRAM_TOKEN = ''
 ADMIN_CHAT_ID = ''
 GUARDIANSHIP_URL = 'https://moscowzoo.ru/about/guardianship'
+# Render the next quiz question by editing the answered message instead of delete-and-resend
+QUIZ_EDIT_IN_PLACE = True
+# Seconds the bot waits for in-flight updates and background sends on shutdown before cancelling them
+BOT_SHUTDOWN_TIMEOUT = 10
+# Per-user bot state kept in memory; evicted users are spilled to the CACHE_ALIAS cache when SPILL is on
+BOT_USER_STATE = {
+    'MAX_USERS': 10000,
+    'IDLE_TIMEOUT': 3600,
+    'SWEEP_INTERVAL': 60,
+    'SPILL': True,
+    'SPILL_TIMEOUT': 7 * 24 * 3600,
+    'CACHE_ALIAS': 'user_state',
+}
+# Seconds after which an unfinished /contact or /feedback conversation is dropped
+BOT_CONVERSATION_TIMEOUT = 600
+# Forwarding of stored feedback and guardianship messages to ADMIN_CHAT_ID:
+# 'immediate' forwards right after saving, 'digest' sends combined messages every DIGEST_INTERVAL seconds;
+# a message Telegram rejects MAX_ATTEMPTS times is no longer forwarded and stays in the admin panel
+CONTACT_FORWARDING = {
+    'MODE': 'immediate',
+    'DIGEST_INTERVAL': 600,
+    'RETRY_INTERVAL': 60,
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+}
+# Opt-in recording of incoming updates (user ids anonymized) for manage.py replay_updates
+BOT_UPDATE_RECORDING = {
+    'FILE': None,
+    'MAX_BYTES': 50 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    'SALT': '',
+}
+# Update queue depth and smoothed handler latency (seconds) at which the bot sheds load
+BOT_LOAD_SHEDDING = {
+    'SOFT_QUEUE_DEPTH': 50,
+    'HARD_QUEUE_DEPTH': 200,
+    'SOFT_LATENCY': 1.0,
+    'HARD_LATENCY': 3.0,
+    'LATENCY_WINDOW': 10.0,
+}
+# Event loop watchdog: stack traces of the loop thread are logged after STALL_THRESHOLD seconds without
+# a heartbeat; /healthz, /readyz and /metrics are served on HEALTH_HOST:HEALTH_PORT when the port is set
+BOT_WATCHDOG = {
+    'INTERVAL': 1.0,
+    'STALL_THRESHOLD': 5.0,
+    'LIVENESS_TIMEOUT': 30.0,
+    'READY_MAX_LOOP_LAG': 1.0,
+    'READY_MAX_API_SILENCE': 60.0,
+    'HEALTH_HOST': '127.0.0.1',
+    'HEALTH_PORT': None,
+}
+# Searchable copy of the bot log in the sessions database (records of LEVEL and above, kept RETENTION_DAYS)
+BOT_LOG_STORE = {
+    'ENABLED': True,
+    'LEVEL': 'INFO',
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 2.0,
+    'RETENTION_DAYS': 30,
+    'PRUNE_INTERVAL': 3600,
+}
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
@@ -77,11 +137,67 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Quiz content lives in 'default'; high-churn data (answers, user messages, sessions, cache table)
+# is routed to 'sessions' so that content reads never wait behind session writes, and the bot log
+# store has its own 'logs' database so that log writes never wait behind answer writes.
+# Apply migrations to all three: python manage.py migrate, then again with --database=sessions and --database=logs
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    'sessions': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_sessions.sqlite3',
+    },
+    'logs': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_logs.sqlite3',
+    },
+}
+
+DATABASE_ROUTERS = ['quiz.db_routers.SessionDataRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Shared L2 cache for the bot. In production point it to Redis:
+# 'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'
+
+# 'bot_cache_versions' keeps the bot cache family versions apart from culled entries; 'user_state' holds
+# spilled user state in the sessions database and is sized for many more users than stay in memory
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    'bot_cache_versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'versions',
+        'TIMEOUT': None,
+    },
+    'user_state': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'bot_user_state',
+        'TIMEOUT': BOT_USER_STATE['SPILL_TIMEOUT'],
+        'OPTIONS': {
+            'MAX_ENTRIES': 10 * BOT_USER_STATE['MAX_USERS'],
+        },
+    },
+}
+
+# Two-tier bot cache: in-process LRU (L1) in front of the CACHES alias (L2); family versions live in VERSION_ALIAS
+BOT_CACHE = {
+    'ALIAS': 'default',
+    'VERSION_ALIAS': 'bot_cache_versions',
+    'TIMEOUT': 300,
+    'L1_MAX_ENTRIES': 1024,
+    'L1_TIMEOUT': 60,
+    'VERSION_CHECK_INTERVAL': 5,
 }
 
 
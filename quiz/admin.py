@@ -1,11 +1,18 @@
 import os
+from urllib.parse import quote
 from django.contrib import admin
-from django.utils.html import mark_safe
+from django.utils.html import format_html, mark_safe
 from django.conf import settings
 from django.http import HttpResponse, HttpResponseNotFound
-from django.urls import path
+from django.shortcuts import get_object_or_404, render
+from django.urls import path, reverse
 from django.contrib.admin.views.decorators import staff_member_required
-from .models import Animal, Question, Answer, QuizQuestion, Quiz
+from django.db.models.expressions import RawSQL
+from .analysis import QuizTooLargeError, cached_quiz_balance
+from .log_store import LOG_SEARCH_TABLE, build_match_query, supports_full_text_search
+from .models import Animal, Question, Answer, QuizQuestion, Quiz, ContactMessage, BotLogRecord
+
+QUIZ_ANALYSIS_MAX_STATES = 300_000
 
 
 @admin.register(Animal)
@@ -63,7 +70,7 @@ class QuizQuestionInline(admin.TabularInline):
 
 @admin.register(Quiz)
 class QuizAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "questions_list")
+    list_display = ("id", "name", "questions_list", "analysis_link")
     inlines = [QuizQuestionInline]
 
     def questions_list(self, obj):
@@ -72,6 +79,80 @@ class QuizAdmin(admin.ModelAdmin):
 
     questions_list.short_description = "Вопросы"
 
+    def analysis_link(self, obj):
+        return mark_safe(f'<a href="{reverse("admin:analyze-quiz", args=[obj.id])}">Анализ баланса</a>')
+
+    analysis_link.short_description = "Баланс"
+
+
+@admin.register(ContactMessage)
+class ContactMessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "created_at", "kind", "user_link", "animal", "short_text", "forwarded_at", "forward_attempts",
+                    "is_handled")
+    list_filter = ("kind", "is_handled", "created_at")
+    list_editable = ("is_handled",)
+    list_select_related = ()
+    search_fields = ("text", "telegram_username", "=telegram_user_id")
+    readonly_fields = ("kind", "telegram_user_id", "telegram_username", "animal", "text", "created_at",
+                       "forwarded_at", "forward_attempts")
+    actions = ["mark_handled"]
+
+    def user_link(self, obj):
+        if obj.telegram_username:
+            return format_html('<a href="https://t.me/{}" target="_blank">@{}</a>',
+                               quote(obj.telegram_username), obj.telegram_username)
+        return obj.telegram_user_id
+
+    user_link.short_description = "Пользователь"
+
+    def short_text(self, obj):
+        return obj.text if len(obj.text) <= 100 else f"{obj.text[:100]}…"
+
+    short_text.short_description = "Сообщение"
+
+    @admin.action(description="Отметить как обработанные")
+    def mark_handled(self, request, queryset):
+        queryset.update(is_handled=True)
+
+
+@admin.register(BotLogRecord)
+class BotLogRecordAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "level", "telegram_user_id", "quiz_id", "event", "short_message")
+    list_filter = ("level", "event", "created_at")
+    date_hierarchy = "created_at"
+    search_fields = ("message",)
+    search_help_text = "Слова из текста сообщения или Telegram User ID"
+    list_per_page = 50
+    show_full_result_count = False
+
+    def short_message(self, obj):
+        return obj.message if len(obj.message) <= 150 else f"{obj.message[:150]}…"
+
+    short_message.short_description = "Сообщение"
+
+    def lookup_allowed(self, lookup, value):
+        return lookup in ("telegram_user_id", "quiz_id", "created_at__gte", "created_at__lt") \
+            or super().lookup_allowed(lookup, value)
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.lstrip("-").isdigit():
+            return queryset.filter(telegram_user_id=int(search_term)), False
+        if not supports_full_text_search(BotLogRecord):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {LOG_SEARCH_TABLE} WHERE {LOG_SEARCH_TABLE} MATCH %s",
+            [build_match_query(search_term)]
+        )), False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @staff_member_required
 def download_log_view(request):
@@ -85,9 +166,22 @@ def download_log_view(request):
         return HttpResponseNotFound("Лог файл не найден.")
 
 
+@staff_member_required
+def analyze_quiz_view(request, quiz_id):
+    quiz = get_object_or_404(Quiz, pk=quiz_id)
+    context = dict(admin.site.each_context(request), quiz=quiz, title=f"Анализ баланса: {quiz.name}")
+    balance = cached_quiz_balance(quiz, QUIZ_ANALYSIS_MAX_STATES)
+    if isinstance(balance, QuizTooLargeError):
+        context["error"] = str(balance)
+    else:
+        context["balance"] = balance
+    return render(request, "admin/quiz_analysis.html", context)
+
+
 def get_admin_urls(urls):
     custom_urls = [
         path('download-log/', download_log_view, name='download-log'),
+        path('analyze-quiz/<int:quiz_id>/', analyze_quiz_view, name='analyze-quiz'),
     ]
     return custom_urls + urls
 
@@ -0,0 +1,200 @@
+import math
+from collections import Counter, defaultdict
+from fractions import Fraction
+from .cache import bot_cache
+from .models import Animal, Answer
+
+BALANCE_CACHE_FAMILY = "quiz_balance"
+BALANCE_CACHE_TIMEOUT = 30 * 24 * 3600
+
+
+class QuizTooLargeError(Exception):
+    pass
+
+
+class QuizBalance:
+    def __init__(self, quiz, total_paths, probabilities, no_result_probability, animals, skipped_questions):
+        self.quiz = quiz
+        self.total_paths = total_paths
+        self.probabilities = probabilities
+        self.no_result_probability = no_result_probability
+        self.animals = animals
+        self.skipped_questions = skipped_questions
+
+    @property
+    def no_result_percent(self):
+        return float(self.no_result_probability) * 100
+
+    def rows(self):
+        uniform = Fraction(1, len(self.animals)) if self.animals else Fraction(0)
+        rows = []
+        for animal in self.animals:
+            probability = self.probabilities.get(animal.id, Fraction(0))
+            rows.append({
+                "animal": animal,
+                "probability": float(probability),
+                "percent": float(probability) * 100,
+                "paths": float(probability * self.total_paths),
+                "unreachable": probability == 0,
+                "dominant": uniform > 0 and probability >= 2 * uniform,
+            })
+        rows.sort(key=lambda row: row["probability"], reverse=True)
+        return rows
+
+
+def load_answer_vectors(quiz):
+    questions = [qq.question for qq in quiz.quiz_questions.select_related("question").order_by("order")]
+    links = defaultdict(set)
+    for answer_id, animal_id in Answer.animals.through.objects.filter(
+            answer__question__in=questions).values_list("answer_id", "animal_id"):
+        links[answer_id].add(animal_id)
+    answers_by_question = defaultdict(list)
+    for answer_id, question_id in Answer.objects.filter(question__in=questions).values_list("id", "question_id"):
+        answers_by_question[question_id].append(frozenset(links[answer_id]))
+    return questions, answers_by_question
+
+
+DEAD = 0x7E
+
+
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def group_equal_rows(np, words):
+    """
+    Перестановка строк, ставящая одинаковые строки рядом, и начала групп. Сортируется один
+    64-битный хэш строки; если в группу попали разные строки (коллизия), строки сортируются
+    лексикографически.
+    """
+    multiplier = np.uint64(HASH_MULTIPLIER)
+    key = words[:, 0].copy()
+    for column in range(1, words.shape[1]):
+        key = (key ^ (key >> np.uint64(31))) * multiplier + words[:, column]
+    key = (key ^ (key >> np.uint64(29))) * multiplier
+    order = np.argsort(key)
+    first = np.ones(len(order), dtype=bool)
+    sorted_key = key[order]
+    first[1:] = sorted_key[1:] != sorted_key[:-1]
+    sorted_words = words[order]
+    group = np.cumsum(first) - 1
+    if (sorted_words != sorted_words[np.flatnonzero(first)][group]).any():
+        order = np.lexsort(words.T[::-1])
+        sorted_words = words[order]
+        first[1:] = (sorted_words[1:] != sorted_words[:-1]).any(axis=1)
+    return order, np.flatnonzero(first)
+
+
+def count_result_paths(answer_sets_per_question, animal_ids, max_states=None):
+    """
+    Число комбинаций ответов для каждого итогового состояния. Состояние — отставание каждого
+    животного от лидера; животное, которое не догонит лидера даже при выборе его во всех
+    оставшихся вопросах, помечается как выбывшее (DEAD). Победители и ничьи в calculate_result
+    от этого не меняются, а одинаковые состояния сливаются, поэтому стоимость зависит от числа
+    различных состояний, а не от числа комбинаций. Состояния хранятся строками матрицы numpy,
+    и переход по каждому ответу считается сразу для всех состояний.
+    """
+    # numpy нужен только анализу, а модуль импортируется и ботом (через quiz.signals).
+    import numpy as np
+
+    if len(answer_sets_per_question) >= DEAD - 1:
+        raise QuizTooLargeError(f"Слишком много вопросов для анализа: {len(answer_sets_per_question)}")
+    if math.prod(len(answer_sets) for answer_sets in answer_sets_per_question) >= 2 ** 63:
+        raise QuizTooLargeError("Число комбинаций ответов не помещается в 64 бита")
+    count = len(animal_ids)
+    index = {animal_id: i for i, animal_id in enumerate(animal_ids)}
+    # Последний столбец — признак «хотя бы один ответ был связан с животным»; ширина строки
+    # кратна 8 байтам, чтобы сравнивать состояния как несколько uint64.
+    width = (count + 1 + 7) // 8 * 8
+
+    steps_per_question = []
+    for answer_sets in answer_sets_per_question:
+        steps = Counter(tuple(int(animal_id in animals) for animal_id in animal_ids) for animals in answer_sets)
+        steps_per_question.append([(np.array(mask + (0,) * (width - count), dtype=np.int8), multiplicity)
+                                   for mask, multiplicity in steps.items()])
+
+    remaining_gain = np.zeros(width, dtype=np.int8)
+    gains = []
+    for steps in reversed(steps_per_question):
+        gains.append(remaining_gain[:count])
+        remaining_gain = remaining_gain + np.bitwise_or.reduce([mask for mask, _ in steps])
+    gains.reverse()
+
+    deficits = np.zeros((1, width), dtype=np.int8)
+    paths = np.ones(1, dtype=np.int64)
+    for steps, gain in zip(steps_per_question, gains):
+        parts = []
+        for mask, multiplicity in steps:
+            advanced = deficits - mask
+            advanced[:, :count] -= advanced[:, :count].min(axis=1, keepdims=True)
+            if mask.any():
+                advanced[:, count] = 1
+            parts.append(advanced)
+        deficits = np.concatenate(parts)
+        paths = np.concatenate([paths * multiplicity for _, multiplicity in steps])
+        lanes = deficits[:, :count]
+        lanes[lanes > gain] = DEAD
+
+        order, starts = group_equal_rows(np, deficits.view(np.uint64))
+        paths = np.add.reduceat(paths[order], starts)
+        deficits = deficits[order[starts]]
+        if max_states is not None and len(deficits) > max_states:
+            raise QuizTooLargeError(f"Число различных состояний превысило {max_states}")
+    return {(tuple(row[:count].tolist()), bool(row[count])): int(path_count)
+            for row, path_count in zip(deficits, paths)}, index
+
+
+def analyze_quiz_balance(quiz, max_states=None):
+    questions, answers_by_question = load_answer_vectors(quiz)
+    answer_sets_per_question = []
+    skipped_questions = []
+    for question in questions:
+        if answers_by_question[question.id]:
+            answer_sets_per_question.append(answers_by_question[question.id])
+        else:
+            skipped_questions.append(question)
+
+    linked_ids = sorted({animal_id for answer_sets in answer_sets_per_question
+                         for animals in answer_sets for animal_id in animals})
+    states, index = count_result_paths(answer_sets_per_question, linked_ids, max_states)
+
+    total_paths = sum(states.values())
+    # Пути копятся целыми числами по размеру ничьей, дроби собираются один раз в конце.
+    tied_paths = defaultdict(Counter)
+    no_result_paths = 0
+    for (counts, counted), paths in states.items():
+        if not counted:
+            no_result_paths += paths
+            continue
+        winners = [animal_id for animal_id in linked_ids if counts[index[animal_id]] == 0]
+        for animal_id in winners:
+            tied_paths[animal_id][len(winners)] += paths
+    wins = {animal_id: sum(Fraction(paths, ties) for ties, paths in by_ties.items())
+            for animal_id, by_ties in tied_paths.items()}
+
+    probabilities = {animal_id: paths / total_paths for animal_id, paths in wins.items()} if total_paths else {}
+    no_result_probability = Fraction(no_result_paths, total_paths) if total_paths else Fraction(0)
+    return QuizBalance(quiz, total_paths, probabilities, no_result_probability,
+                       list(Animal.objects.order_by("name")), skipped_questions)
+
+
+def store_quiz_balance(quiz, balance):
+    # Результат не попадает в L1, поэтому перезапись одной записи L2 сразу видна другим
+    # процессам (админке) и не сбрасывает сохранённые результаты остальных викторин.
+    bot_cache.set(BALANCE_CACHE_FAMILY, quiz.id, balance, timeout=BALANCE_CACHE_TIMEOUT, l1=False)
+
+
+def cached_quiz_balance(quiz, max_states):
+    """
+    Результат analyze_quiz_balance() из bot_cache, пересчитываемый только после изменения содержимого
+    викторин (quiz.signals). Превышение max_states тоже кэшируется как QuizTooLargeError, чтобы
+    слишком большая викторина не пересчитывалась при каждом открытии страницы; полный расчёт
+    сохраняет команда analyze_quiz.
+    """
+    balance = bot_cache.get(BALANCE_CACHE_FAMILY, quiz.id, l1=False)
+    if balance is None:
+        try:
+            balance = analyze_quiz_balance(quiz, max_states=max_states)
+        except QuizTooLargeError as e:
+            balance = e
+        store_quiz_balance(quiz, balance)
+    return balance
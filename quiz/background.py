@@ -0,0 +1,24 @@
+import asyncio
+
+_tasks = set()
+
+
+def run_in_background(coroutine, name=None):
+    task = asyncio.get_running_loop().create_task(coroutine, name=name)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+def pending_count():
+    return len(_tasks)
+
+
+async def drain(timeout):
+    tasks = _tasks - {asyncio.current_task()}
+    if not tasks:
+        return 0
+    _, pending = await asyncio.wait(tasks, timeout=max(timeout, 0))
+    for task in pending:
+        task.cancel()
+    return len(pending)
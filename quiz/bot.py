@@ -1,27 +1,52 @@
+import asyncio
+import html
 import random
-from asgiref.sync import sync_to_async, async_to_sync
+import signal
+import time
 from django.conf import settings
-from django.core.cache import cache
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, BotCommand
 from telegram.error import BadRequest
 from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes, ConversationHandler, \
-    MessageHandler, filters
-from quiz.models import Quiz, UserQuizAnswer, Question, Animal
+    MessageHandler, TypeHandler, ApplicationHandlerStop, filters
+from quiz.models import ContactMessage
 from urllib.parse import quote
+from . import metrics
+from .background import run_in_background, drain
 from .bot_logger import BotLogger
+from .cache import bot_cache
+from .repository import get_active_quiz, get_quiz, get_question, cleanup_user_answers, get_first_question, \
+    get_question_keyboard, store_user_answer, get_next_question, get_animal_by_id, calculate_result, \
+    save_contact_message, get_pending_contact_messages, mark_contact_messages_forwarded, \
+    record_contact_forward_failure, warm_up_caches
+from .update_recorder import UpdateRecorder
+from .watchdog import watchdog, WatchedRequest
+from .user_state import user_state_tracker, spill_key, spill_cache, current_rss_bytes
+from .load_shedding import load_monitor, NORMAL, SOFT, HARD, LEVEL_NAMES
+from .callback_data import START_QUIZ, QUIZ_ANSWER, CONTACT_GUARDIANSHIP, encode_callback_data, \
+    decode_callback_data, callback_tag_pattern
 
-CACHE_TIMEOUT = 300
 TELEGRAM_BASE_URL = "https://t.me/"
 CONTACT, FEEDBACK = range(2)
+RECORD_UPDATE_GROUP = -200
+BEFORE_UPDATE_GROUP = -100
+AFTER_UPDATE_GROUP = 100
+DEFERRED_SEND_POLL_INTERVAL = 1
+HANDLER_DRAIN_POLL_INTERVAL = 0.05
+BUSY_TEXT = "Бот сейчас перегружен, попробуйте ещё раз через минуту."
+START_QUIZ_CALLBACK_DATA = encode_callback_data(START_QUIZ)
+SESSION_NONCE_BITS = 16
+ADMIN_MESSAGE_MAX_LENGTH = 4096
+DIGEST_SEPARATOR = "\n\n———\n\n"
 
 logger = BotLogger('bot.log')
+update_recorder = UpdateRecorder.from_settings()
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    logger.log_info(f"Пользователь {user.id} запустил команду /start")
+    logger.log_info(f"Пользователь {user.id} запустил команду /start", user_id=user.id, event="start")
     markup = InlineKeyboardMarkup([
-        [InlineKeyboardButton("Узнать моё тотемное животное", callback_data="start_quiz")]
+        [InlineKeyboardButton("Узнать моё тотемное животное", callback_data=START_QUIZ_CALLBACK_DATA)]
     ])
     text = (
         "Добро пожаловать в бот Московского Зоопарка!\n\n"
@@ -34,97 +59,20 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(text, reply_markup=markup)
 
 
-@sync_to_async
-def get_active_quiz():
-    cache_key = "active_quiz"
-    quiz = cache.get(cache_key)
-    if quiz is None:
-        quiz = Quiz.objects.filter(is_active=True).first()
-        cache.set(cache_key, quiz, timeout=CACHE_TIMEOUT)
-    return quiz
-
-
-@sync_to_async
-def cleanup_user_answers(user_id, quiz_id):
-    UserQuizAnswer.objects.filter(telegram_user_id=user_id, quiz_id=quiz_id).delete()
-
-
-@sync_to_async
-def get_first_question(quiz):
-    cache_key = f"first_question_{quiz.id}"
-    first_question = cache.get(cache_key)
-    if first_question is None:
-        qq = quiz.quiz_questions.order_by("order").first()
-        first_question = qq.question if qq else None
-        cache.set(cache_key, first_question, timeout=CACHE_TIMEOUT)
-    return first_question
-
-
-@sync_to_async
-def get_answers_for_question(question):
-    cache_key = f"answers_for_question_{question.id}"
-    answers = cache.get(cache_key)
-    if answers is None:
-        answers = list(question.answers.all())
-        cache.set(cache_key, answers, timeout=CACHE_TIMEOUT)
-    return answers
-
-
-@sync_to_async
-def store_user_answer(user_id, quiz_id, question_id, answer_id):
-    return UserQuizAnswer.objects.create(
-        telegram_user_id=user_id,
-        quiz_id=quiz_id,
-        question_id=question_id,
-        answer_id=answer_id
-    )
-
-
-@sync_to_async
-def get_next_question(quiz, question):
-    cache_key = f"next_question_{quiz.id}_{question.id}"
-    next_question = cache.get(cache_key)
-    if next_question is not None:
-        return next_question
-
-    current_qq = quiz.quiz_questions.filter(question=question).first()
-    if not current_qq:
-        return None
-
-    next_qq = quiz.quiz_questions.filter(order__gt=current_qq.order).order_by("order").first()
-    next_question = next_qq.question if next_qq else None
-    cache.set(cache_key, next_question, timeout=CACHE_TIMEOUT)
-    return next_question
+def acquire_user_slot(context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    in_flight = context.bot_data.setdefault("in_flight_users", set())
+    if user_id in in_flight:
+        return False
+    in_flight.add(user_id)
+    return True
 
 
-@sync_to_async
-def get_animal_by_id(animal_id):
-    cache_key = f"animal_{animal_id}"
-    animal = cache.get(cache_key)
-    if animal is None:
-        animal = Animal.objects.filter(id=animal_id).first()
-        cache.set(cache_key, animal, timeout=CACHE_TIMEOUT)
-    return animal
+def release_user_slot(context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    context.bot_data.setdefault("in_flight_users", set()).discard(user_id)
 
 
-@sync_to_async
-def calculate_result(user_id, quiz_id):
-    user_answers = UserQuizAnswer.objects.filter(telegram_user_id=user_id, quiz_id=quiz_id)
-    if not user_answers.exists():
-        return None
-
-    counts = {}
-    for ua in user_answers:
-        for animal in ua.answer.animals.all():
-            counts[animal.id] = counts.get(animal.id, 0) + 1
-
-    if not counts:
-        return None
-
-    max_count = max(counts.values())
-    max_ids: list[int] = [aid for aid, cnt in counts.items() if cnt == max_count]
-    chosen_id = random.choice(max_ids)
-    return async_to_sync(get_animal_by_id)(chosen_id)
+def start_quiz_session(context: ContextTypes.DEFAULT_TYPE):
+    context.user_data["quiz_session"] = {"nonce": random.getrandbits(SESSION_NONCE_BITS), "step": 0}
 
 
 async def clear_current_question_message(update: Update, context: ContextTypes.DEFAULT_TYPE, message_id: int = None):
@@ -140,33 +88,51 @@ async def clear_current_question_message(update: Update, context: ContextTypes.D
         context.user_data["current_question_message_id"] = None
 
 
+async def edit_question_message(update: Update, question, markup):
+    query = update.callback_query
+    if not settings.QUIZ_EDIT_IN_PLACE or not query or not query.message:
+        return False
+    try:
+        await query.edit_message_text(text=question.text, reply_markup=markup)
+    except BadRequest as e:
+        logger.log_debug(f"Не удалось отредактировать вопрос, отправляем новым сообщением: {e}")
+        return False
+    return True
+
+
 async def show_question(update: Update, context: ContextTypes.DEFAULT_TYPE,
-                        quiz, question, previous_message_id=None):
-    if previous_message_id:
-        await clear_current_question_message(update, context, previous_message_id)
-    answers = await get_answers_for_question(question)
-    if not answers:
+                        quiz, question, previous_message_id=None, edit=False):
+    layout = await get_question_keyboard(question)
+    if not layout:
+        if previous_message_id:
+            await clear_current_question_message(update, context, previous_message_id)
         await update.effective_message.reply_text("Ошибка: у вопроса нет вариантов ответа!")
         error_msg = f"Вопрос {question.id} не содержит ответов"
         logger.log_error(error_msg)
         await notify_admin_error(error_msg, context)
         return
 
-    keyboard = []
-    row = []
-    for i, ans in enumerate(answers, start=1):
-        cb_data = f"quiz:{quiz.id}|{question.id}|{ans.id}"
-        button = InlineKeyboardButton(ans.text, callback_data=cb_data)
-        row.append(button)
-        if len(row) == 2:
-            keyboard.append(row)
-            row = []
-    if row:
-        keyboard.append(row)
-    markup = InlineKeyboardMarkup(keyboard)
+    session = context.user_data.get("quiz_session") or {"nonce": 0, "step": 0}
+    markup = InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(text, callback_data=encode_callback_data(
+                QUIZ_ANSWER, quiz.id, question.id, answer_id, session["nonce"], session["step"]))
+            for text, answer_id in row
+        ]
+        for row in layout
+    ])
 
+    if edit and await edit_question_message(update, question, markup):
+        context.user_data["current_question_message_id"] = update.callback_query.message.message_id
+        metrics.increment("question_edited")
+        logger.log_debug(f"Вопрос {question.id} показан пользователю {update.effective_user.id} редактированием")
+        return
+
+    if previous_message_id:
+        await clear_current_question_message(update, context, previous_message_id)
     msg = await update.effective_message.reply_text(text=question.text, reply_markup=markup)
     context.user_data["current_question_message_id"] = msg.message_id
+    metrics.increment("question_sent")
     logger.log_debug(f"Отправлен вопрос {question.id} пользователю {update.effective_user.id}")
 
 
@@ -189,35 +155,33 @@ async def quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await notify_admin_error(error_msg, context)
         return
 
-    logger.log_info(f"Пользователь {update.effective_user.id} начал викторину {quiz.id}")
+    logger.log_info(f"Пользователь {update.effective_user.id} начал викторину {quiz.id}",
+                    user_id=update.effective_user.id, quiz_id=quiz.id, event="quiz_started")
+    start_quiz_session(context)
     await show_question(update, context, quiz, question)
 
 
 async def start_quiz_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await clear_current_question_message(update, context)
     query = update.callback_query
-    await query.answer()
-    logger.log_debug(f"Callback start_quiz получен от пользователя {update.effective_user.id}")
-    await quiz_command(update, context)
-
-
-async def parse_quiz_callback_data(data: str):
-    if not data.startswith("quiz:"):
-        return None
-    payload = data[5:]
+    user_id = update.effective_user.id
+    if not acquire_user_slot(context, user_id):
+        await query.answer()
+        metrics.increment("callback_duplicate_rejected")
+        return
     try:
-        quiz_id_str, question_id_str, answer_id_str = payload.split("|")
-    except ValueError:
-        return None
-    return int(quiz_id_str), int(question_id_str), int(answer_id_str)
+        await clear_current_question_message(update, context)
+        await query.answer()
+        logger.log_debug(f"Callback start_quiz получен от пользователя {user_id}")
+        await quiz_command(update, context)
+    finally:
+        release_user_slot(context, user_id)
 
 
 async def build_result_markup(animal, context):
     guardianship_url = settings.GUARDIANSHIP_URL
     animal_id = animal.id
-    contact_guardianship_callback_data = f"contact_guardianship:{animal_id}"
-    bot_info = await context.bot.get_me()
-    bot_url = f"{TELEGRAM_BASE_URL}{bot_info.username}"
+    contact_guardianship_callback_data = encode_callback_data(CONTACT_GUARDIANSHIP, animal_id)
+    bot_url = f"{TELEGRAM_BASE_URL}{context.bot.username}"
     bot_url_encoded = quote(bot_url, safe='')
     share_text = f"Моё тотемное животное в Московском зоопарке – {animal.name}. Хочешь узнать своё?"
     share_text_encoded = quote(share_text, safe='')
@@ -227,7 +191,7 @@ async def build_result_markup(animal, context):
         [InlineKeyboardButton("Узнать больше", url=guardianship_url)],
         [InlineKeyboardButton("Задать вопрос об опеке", callback_data=contact_guardianship_callback_data)],
         [InlineKeyboardButton("Поделиться в VK", url=vk_share_url)],
-        [InlineKeyboardButton("Попробовать ещё раз?", callback_data="start_quiz")]
+        [InlineKeyboardButton("Попробовать ещё раз?", callback_data=START_QUIZ_CALLBACK_DATA)]
     ])
     return markup
 
@@ -247,7 +211,7 @@ async def end_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id:
     if not animal:
         await query.message.reply_text("Мы не смогли определить ваше животное!")
         error_msg = f"Не удалось определить тотемное животное для пользователя {user_id} в викторине {quiz_id}"
-        logger.log_error(error_msg)
+        logger.log_error(error_msg, user_id=user_id, quiz_id=quiz_id, event="quiz_no_result")
         await notify_admin_error(error_msg, context)
     else:
         result_text = (
@@ -263,7 +227,9 @@ async def end_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id:
             logger.log_error(error_msg)
             await notify_admin_error(error_msg, context)
             await query.message.reply_text(result_text, reply_markup=markup, parse_mode="HTML")
-        logger.log_info(f"Пользователю {user_id} определено тотемное животное: {animal.name}")
+        logger.log_info(f"Пользователю {user_id} определено тотемное животное: {animal.name}",
+                        user_id=user_id, quiz_id=quiz_id, event="quiz_result")
+    context.user_data.pop("quiz_session", None)
     await cleanup_user_answers(user_id, quiz_id)
     await clear_current_question_message(update, context)
 
@@ -271,54 +237,182 @@ async def end_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id:
 async def process_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE,
                               quiz_id: int, question_id: int, answer_id: int):
     user_id = update.effective_user.id
-    logger.log_info(f"Пользователь {user_id} ответил на вопрос {question_id} (ответ {answer_id}) в викторине {quiz_id}")
+    logger.log_info(f"Пользователь {user_id} ответил на вопрос {question_id} (ответ {answer_id}) в викторине {quiz_id}",
+                    user_id=user_id, quiz_id=quiz_id, event="quiz_answer")
     await store_user_answer(user_id, quiz_id, question_id, answer_id)
-    quiz = await sync_to_async(Quiz.objects.get)(pk=quiz_id)
-    question = await sync_to_async(Question.objects.get)(pk=question_id)
+    quiz = await get_quiz(quiz_id)
+    question = await get_question(question_id)
     next_q = await get_next_question(quiz, question)
     if next_q:
         msg_id = context.user_data.get("current_question_message_id")
-        await show_question(update, context, quiz, next_q, previous_message_id=msg_id)
+        await show_question(update, context, quiz, next_q, previous_message_id=msg_id, edit=True)
     else:
         await end_quiz(update, context, user_id, quiz_id)
 
 
-async def quiz_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def quiz_callback(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                        quiz_id: int, question_id: int, answer_id: int, nonce: int = None, step: int = None):
     query = update.callback_query
-    await query.answer()
-    data = query.data
-    logger.log_debug(f"Получен quiz callback: {data} от пользователя {update.effective_user.id}")
-    parsed = await parse_quiz_callback_data(data)
-    if not parsed:
+    user_id = update.effective_user.id
+    if not acquire_user_slot(context, user_id):
+        await query.answer()
+        metrics.increment("callback_duplicate_rejected")
+        return
+    try:
+        session = context.user_data.get("quiz_session")
+        if not session or session["nonce"] != nonce or session["step"] != step:
+            await query.answer("Этот вопрос уже неактуален.")
+            metrics.increment("callback_stale_rejected")
+            logger.log_debug(f"Отклонено устаревшее нажатие {query.data} от пользователя {user_id}")
+            return
+        session["step"] += 1
+        try:
+            await query.answer()
+            logger.log_debug(f"Получен quiz callback: {query.data} от пользователя {user_id}")
+            await process_quiz_answer(update, context, quiz_id, question_id, answer_id)
+        except Exception:
+            # Иначе повторное нажатие на ту же клавиатуру будет отклонено как устаревшее.
+            session["step"] -= 1
+            raise
+    finally:
+        release_user_slot(context, user_id)
+
+
+CALLBACK_ROUTES = {
+    START_QUIZ: (start_quiz_callback, (0,)),
+    QUIZ_ANSWER: (quiz_callback, (3, 5)),
+}
+
+
+async def callback_dispatcher(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    data = update.callback_query.data
+    decoded = decode_callback_data(data)
+    if decoded is None:
+        await update.callback_query.answer()
         error_msg = f"Ошибка разбора callback данных: {data}"
         logger.log_error(error_msg)
         await notify_admin_error(error_msg, context)
         return
-    quiz_id, question_id, answer_id = parsed
-    await process_quiz_answer(update, context, quiz_id, question_id, answer_id)
+    route = CALLBACK_ROUTES.get(decoded[0])
+    if route is None or len(decoded[1]) not in route[1]:
+        # Например, «Задать вопрос об опеке» внутри уже открытого диалога: обработчик диалога
+        # нажатие не принял, и это не ошибка.
+        await update.callback_query.answer()
+        metrics.increment("callback_unrouted")
+        logger.log_debug(f"Нажатие без обработчика {data} от пользователя {update.effective_user.id}")
+        return
+    handler, _ = route
+    await handler(update, context, *decoded[1])
 
 
 async def guardianship_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = build_guardianship_text(True)
     await update.message.reply_text(text, parse_mode="HTML")
-    logger.log_info(f"Пользователь {update.effective_user.id} задал вопрос об опеке")
+    logger.log_info(f"Пользователь {update.effective_user.id} задал вопрос об опеке",
+                    user_id=update.effective_user.id, event="guardianship")
 
 
-async def build_user_profile_link(user):
-    if user.username:
-        link_url = f"{TELEGRAM_BASE_URL}{user.username}"
+def build_profile_link(user_id, username):
+    if username:
+        link_url = html.escape(f"{TELEGRAM_BASE_URL}{quote(username)}")
     else:
-        link_url = f"tg://user?id={user.id}"
+        link_url = f"tg://user?id={user_id}"
     return f'<a href="{link_url}">{link_url}</a>'
 
 
+def escape_truncated(text, max_length):
+    # Обрезается исходный текст, а не экранированный, чтобы не разрезать HTML-сущность.
+    escaped = html.escape(text, quote=False)
+    if len(escaped) <= max_length:
+        return escaped
+    parts, length = [], len("…")
+    for char in text:
+        char = html.escape(char, quote=False)
+        if length + len(char) > max_length:
+            break
+        parts.append(char)
+        length += len(char)
+    return "".join(parts) + "…"
+
+
+def format_contact_message(message, max_length=ADMIN_MESSAGE_MAX_LENGTH):
+    user_link = build_profile_link(message.telegram_user_id, message.telegram_username)
+    if message.kind == ContactMessage.FEEDBACK:
+        header = f"💬 Обратная связь от {user_link}:\n"
+    else:
+        animal_info = f"\n\nТотемное животное: {html.escape(message.animal.name)}." if message.animal else ""
+        header = f"📞 Сообщение про опеку от {user_link}:{animal_info}\n\nСообщение:\n"
+    return header + escape_truncated(message.text, max_length - len(header))
+
+
+def build_digests(messages):
+    header = "📬 Новые сообщения пользователей:"
+    digests = []
+    text, ids = header, []
+    for message in messages:
+        part = format_contact_message(message, ADMIN_MESSAGE_MAX_LENGTH - len(header) - len(DIGEST_SEPARATOR))
+        if ids and len(text) + len(DIGEST_SEPARATOR) + len(part) > ADMIN_MESSAGE_MAX_LENGTH:
+            digests.append((text, ids))
+            text, ids = header, []
+        text += DIGEST_SEPARATOR + part
+        ids.append(message.id)
+    if ids:
+        digests.append((text, ids))
+    return digests
+
+
+async def forward_contact_messages(context: ContextTypes.DEFAULT_TYPE):
+    admin_chat_id = settings.ADMIN_CHAT_ID
+    if not admin_chat_id:
+        return
+    # Уровень load_monitor пересчитывается только при новых обновлениях и может остаться
+    # повышенным после всплеска, поэтому нагрузка оценивается по текущей очереди, как в send_when_idle.
+    if load_monitor.level_for(context.application.update_queue.qsize()) > NORMAL:
+        return
+    lock = context.bot_data.setdefault("contact_forwarding_lock", asyncio.Lock())
+    if lock.locked():
+        return
+    async with lock:
+        messages = await get_pending_contact_messages(settings.CONTACT_FORWARDING["BATCH_SIZE"],
+                                                      settings.CONTACT_FORWARDING["MAX_ATTEMPTS"])
+        if not messages:
+            return
+        if settings.CONTACT_FORWARDING["MODE"] == "digest" and len(messages) > 1:
+            batches = build_digests(messages)
+        else:
+            batches = [(format_contact_message(message), [message.id]) for message in messages]
+        messages_by_id = {message.id: message for message in messages}
+        for text, message_ids in batches:
+            try:
+                await context.bot.send_message(chat_id=admin_chat_id, text=text, parse_mode="HTML")
+            except BadRequest as e:
+                # Telegram отклонил сам текст: дайджест пересылается заново по одному сообщению (цикл дойдёт
+                # до добавленных пачек), а неудачи одиночного сообщения считаются, и после MAX_ATTEMPTS
+                # оно больше не пересылается, чтобы не задерживать остальные.
+                if len(message_ids) > 1:
+                    batches.extend((format_contact_message(messages_by_id[message_id]), [message_id])
+                                   for message_id in message_ids)
+                else:
+                    await record_contact_forward_failure(message_ids[0])
+                    metrics.increment("contact_messages_rejected")
+                    logger.log_error(f"Telegram отклонил сообщение пользователя {message_ids[0]} "
+                                     f"при пересылке администраторам: {e}")
+                continue
+            except Exception as e:
+                logger.log_error(f"Ошибка пересылки сообщений пользователей администраторам: {e}")
+                return
+            await mark_contact_messages_forwarded(message_ids)
+            metrics.increment("contact_messages_forwarded", len(message_ids))
+
+
 async def contact_guardianship_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
-    data = update.callback_query.data
-    if data:
-        animal_id = data[21:]
+    decoded = decode_callback_data(update.callback_query.data)
+    if decoded and decoded[1]:
+        animal_id = decoded[1][0]
         context.user_data["contact_animal_id"] = animal_id
-        logger.log_info(f"Пользователь {update.effective_user.id} задал вопрос об опеке над животным {animal_id}")
+        logger.log_info(f"Пользователь {update.effective_user.id} задал вопрос об опеке над животным {animal_id}",
+                        user_id=update.effective_user.id, event="contact_started")
     else:
         context.user_data["contact_animal_id"] = None
     await update.callback_query.message.reply_text(
@@ -329,53 +423,40 @@ async def contact_guardianship_callback(update: Update, context: ContextTypes.DE
 
 async def contact_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Пожалуйста, введите сообщение для сотрудника зоопарка (или /cancel для отмены):")
-    logger.log_info(f"Пользователь {update.effective_user.id} инициировал контакт через команду /contact")
+    logger.log_info(f"Пользователь {update.effective_user.id} инициировал контакт через команду /contact",
+                    user_id=update.effective_user.id, event="contact_started")
     return CONTACT
 
 
 async def cancel_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Сообщение для сотрудника зоопарка отменено.")
-    logger.log_info(f"Пользователь {update.effective_user.id} отменил отправку сообщения про опеку")
+    logger.log_info(f"Пользователь {update.effective_user.id} отменил отправку сообщения про опеку",
+                    user_id=update.effective_user.id, event="contact_cancelled")
     return ConversationHandler.END
 
 
+def schedule_contact_forwarding(context: ContextTypes.DEFAULT_TYPE):
+    if settings.CONTACT_FORWARDING["MODE"] == "immediate":
+        run_in_background(forward_contact_messages(context))
+
+
 async def receive_contact_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    user_link = await build_user_profile_link(user)
-    contact_message = update.message.text
-    animal_info = ""
     animal_id = context.user_data.get("contact_animal_id")
-    if animal_id:
-        animal = await get_animal_by_id(animal_id)
-        animal_info = f"\n\nТотемное животное: {animal.name}."
-    message_text = f"📞 Сообщение про опеку от {user_link}:{animal_info}\n\nСообщение:\n{contact_message}"
-    admin_chat_id = settings.ADMIN_CHAT_ID
-    if not admin_chat_id:
-        await update.message.reply_text("Обратная связь не настроена.")
-        error_msg = "ADMIN_CHAT_ID не настроен, сообщение не отправлено"
-        logger.log_error(error_msg)
-        await notify_admin_error(error_msg, context)
-    else:
-        await context.bot.send_message(chat_id=admin_chat_id, text=message_text, parse_mode="HTML")
-        await update.message.reply_text("Ваше сообщение отправлено сотруднику зоопарка!")
-        logger.log_info(f"Пользователь {user.id} отправил сообщение про опеку")
+    animal = await get_animal_by_id(animal_id) if animal_id else None
+    await save_contact_message(ContactMessage.GUARDIANSHIP, user, update.message.text, animal.id if animal else None)
+    await update.message.reply_text("Ваше сообщение отправлено сотруднику зоопарка!")
+    logger.log_info(f"Пользователь {user.id} отправил сообщение про опеку", user_id=user.id, event="contact_message")
+    schedule_contact_forwarding(context)
     return ConversationHandler.END
 
 
 async def process_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE, feedback_text: str):
     user = update.effective_user
-    user_link = await build_user_profile_link(user)
-    message_text = f"💬 Обратная связь от {user_link}:\n{feedback_text}"
-    admin_chat_id = settings.ADMIN_CHAT_ID
-    if not admin_chat_id:
-        await update.message.reply_text("Обратная связь не настроена.")
-        error_msg = "ADMIN_CHAT_ID не настроен для обработки обратной связи"
-        logger.log_error(error_msg)
-        await notify_admin_error(error_msg, context)
-        return
-    await context.bot.send_message(chat_id=admin_chat_id, text=message_text, parse_mode="HTML")
+    await save_contact_message(ContactMessage.FEEDBACK, user, feedback_text)
     await update.message.reply_text("Спасибо за вашу обратную связь!")
-    logger.log_info(f"Получена обратная связь от пользователя {user.id}")
+    logger.log_info(f"Получена обратная связь от пользователя {user.id}", user_id=user.id, event="feedback")
+    schedule_contact_forwarding(context)
 
 
 async def feedback_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -396,10 +477,118 @@ async def receive_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cancel_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Обратная связь отменена.")
-    logger.log_info(f"Пользователь {update.effective_user.id} отменил отправку обратной связи")
+    logger.log_info(f"Пользователь {update.effective_user.id} отменил отправку обратной связи",
+                    user_id=update.effective_user.id, event="feedback_cancelled")
     return ConversationHandler.END
 
 
+def is_quiz_start(update: Update):
+    if update.callback_query:
+        decoded = decode_callback_data(update.callback_query.data)
+        return decoded is not None and decoded[0] == START_QUIZ
+    text = update.message.text if update.message else None
+    return bool(text) and text.split(maxsplit=1)[0].split("@")[0] in ("/start", "/quiz")
+
+
+async def spill_user_states(states):
+    await spill_cache().aset_many({spill_key(user_id): data for user_id, data in states.items()},
+                                  timeout=settings.BOT_USER_STATE["SPILL_TIMEOUT"])
+
+
+async def restore_user_state(user_id):
+    data = await spill_cache().aget(spill_key(user_id))
+    if data is not None:
+        await spill_cache().adelete(spill_key(user_id))
+    return data
+
+
+def update_memory_gauges(application):
+    metrics.set_gauge("user_data_entries", len(application.user_data))
+    metrics.set_gauge("chat_data_entries", len(application.chat_data))
+    metrics.set_gauge("tracked_users", len(user_state_tracker))
+    metrics.set_gauge("rss_bytes", current_rss_bytes())
+
+
+async def evict_idle_users(context: ContextTypes.DEFAULT_TYPE):
+    application = context.application
+    evicted = user_state_tracker.select_evictions(protected=context.bot_data.get("in_flight_users", set()))
+    selected_at = {user_id: user_state_tracker.last_seen(user_id) for user_id in evicted}
+    states = {}
+    for user_id in evicted:
+        data = application.user_data.get(user_id)
+        if data and settings.BOT_USER_STATE["SPILL"]:
+            states[user_id] = dict(data)
+    if states:
+        await spill_user_states(states)
+    # Пока состояние записывалось, пользователь мог прислать новое обновление и изменить user_data:
+    # такие пользователи остаются в памяти, а их сохранённая копия удаляется, чтобы её не восстановили позже.
+    touched = [user_id for user_id in evicted if user_state_tracker.last_seen(user_id) != selected_at[user_id]]
+    if touched:
+        await spill_cache().adelete_many([spill_key(user_id) for user_id in touched if user_id in states])
+    evicted = [user_id for user_id in evicted if user_id not in touched]
+    for user_id in evicted:
+        user_state_tracker.forget(user_id)
+        application.drop_user_data(user_id)
+        application.drop_chat_data(user_id)
+    if evicted:
+        metrics.increment("user_state_evicted", len(evicted))
+        spilled = sum(user_id in states for user_id in evicted)
+        logger.log_debug(f"Вытеснено состояние пользователей: {len(evicted)}, сохранено: {spilled}")
+    update_memory_gauges(application)
+
+
+async def track_user_state(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    if not user:
+        return
+    if user.id not in context.application.user_data and settings.BOT_USER_STATE["SPILL"]:
+        data = await restore_user_state(user.id)
+        if data:
+            context.user_data.update(data)
+            metrics.increment("user_state_restored")
+    user_state_tracker.touch(user.id)
+
+
+async def admit_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    previous_level = load_monitor.level
+    level = load_monitor.update_level(context.application.update_queue.qsize())
+    metrics.set_gauge("update_queue_depth", load_monitor.queue_depth)
+    metrics.set_gauge("handler_latency", round(load_monitor.latency, 4))
+    metrics.set_gauge("load_level", level)
+    if level != previous_level:
+        logger.log_info(f"Уровень нагрузки: {LEVEL_NAMES[level]} (очередь {load_monitor.queue_depth}, "
+                        f"задержка {load_monitor.latency:.2f} с)")
+        logger.set_debug_enabled(level == NORMAL)
+
+    if level >= SOFT and is_quiz_start(update):
+        metrics.increment("shed_quiz_start")
+        if update.callback_query:
+            await update.callback_query.answer(BUSY_TEXT)
+        else:
+            await update.message.reply_text(BUSY_TEXT)
+        raise ApplicationHandlerStop
+    if level == HARD and update.callback_query:
+        metrics.increment("shed_callback")
+        await update.callback_query.answer(BUSY_TEXT)
+        raise ApplicationHandlerStop
+    context.bot_data.setdefault("handling_started", {})[update.update_id] = time.monotonic()
+    context.bot_data.setdefault("handler_tasks", {})[update.update_id] = asyncio.current_task()
+    await track_user_state(update, context)
+
+
+async def finish_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.bot_data.setdefault("handler_tasks", {}).pop(update.update_id, None)
+    handling_started = context.bot_data.setdefault("handling_started", {}).pop(update.update_id, None)
+    if handling_started is not None:
+        load_monitor.record_latency(time.monotonic() - handling_started)
+    watchdog.mark_update()
+
+    started_at = context.bot_data.pop("started_at", None)
+    if started_at is not None:
+        elapsed = time.monotonic() - started_at
+        logger.log_info(f"Первое обновление обработано через {elapsed:.2f} с после запуска")
+
+
 async def post_init(application):
     await application.bot.set_my_commands([
         BotCommand("quiz", "Викторина"),
@@ -409,35 +598,152 @@ async def post_init(application):
     ])
     logger.log_info("Бот инициализирован: команды установлены")
 
+    quiz, questions_count, animals_count = await warm_up_caches()
+    if quiz is None:
+        logger.log_error("Прогрев кэша: активная викторина не найдена")
+    else:
+        logger.log_info(f"Прогрев кэша: викторина {quiz.id}, вопросов {questions_count}, животных {animals_count}")
+
+    install_stop_signals(application)
+    watchdog.start(logger)
+    if not settings.ADMIN_CHAT_ID:
+        logger.log_error("ADMIN_CHAT_ID не настроен: сообщения пользователей сохраняются без пересылки")
+    forwarding_interval = settings.CONTACT_FORWARDING["DIGEST_INTERVAL"] \
+        if settings.CONTACT_FORWARDING["MODE"] == "digest" else settings.CONTACT_FORWARDING["RETRY_INTERVAL"]
+    application.job_queue.run_repeating(forward_contact_messages, interval=forwarding_interval, first=0,
+                                        name="forward_contact_messages")
+    application.job_queue.run_repeating(evict_idle_users, interval=settings.BOT_USER_STATE["SWEEP_INTERVAL"],
+                                        name="evict_idle_users")
+
+    started_at = application.bot_data.get("started_at")
+    if started_at is not None:
+        elapsed = time.monotonic() - started_at
+        logger.log_info(f"Бот @{application.bot.username} готов к приёму обновлений через {elapsed:.2f} с после запуска")
+
+
+async def drain_handlers(application, timeout):
+    # Application.stop() ждёт обработки начатых обновлений без ограничения по времени, поэтому
+    # обработчики, не завершившиеся к дедлайну, отменяются. Задачу каждого обновления запоминает
+    # admit_update(), а finish_update() убирает её. При последовательной обработке это задача
+    # получения обновлений PTB: её отмена прерывает зависший обработчик, а оставшиеся обновления
+    # она отбросит сама.
+    handler_tasks = application.bot_data.setdefault("handler_tasks", {})
+    deadline = time.monotonic() + max(timeout, 0)
+    while handler_tasks and time.monotonic() < deadline:
+        await asyncio.sleep(HANDLER_DRAIN_POLL_INTERVAL)
+    tasks = {task for task in handler_tasks.values() if not task.done() and task is not asyncio.current_task()}
+    handler_tasks.clear()
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.wait(tasks)
+    return len(tasks)
+
+
+async def graceful_stop(application):
+    if application.bot_data.get("stopping"):
+        logger.log_info("Повторный сигнал остановки: прерываем обработчики и фоновые задачи")
+        interrupted_handlers = await drain_handlers(application, 0)
+        dropped_tasks = await drain(0)
+        logger.log_error(f"Принудительная остановка: прервано обработчиков {interrupted_handlers}, "
+                         f"фоновых задач {dropped_tasks}")
+        logger.flush()
+        application.stop_running()
+        return
+    application.bot_data["stopping"] = True
+    watchdog.stopping = True
+    logger.log_info("Получен сигнал остановки: прекращаем приём обновлений")
+    deadline = time.monotonic() + settings.BOT_SHUTDOWN_TIMEOUT
+    if application.updater and application.updater.running:
+        await application.updater.stop()
+
+    dropped_updates = 0
+    try:
+        await asyncio.wait_for(asyncio.shield(application.update_queue.join()), deadline - time.monotonic())
+    except asyncio.TimeoutError:
+        while not application.update_queue.empty():
+            application.update_queue.get_nowait()
+            application.update_queue.task_done()
+            dropped_updates += 1
+
+    dropped_tasks = await drain(deadline - time.monotonic())
+    interrupted_handlers = await drain_handlers(application, deadline - time.monotonic())
+    if dropped_updates or dropped_tasks or interrupted_handlers:
+        logger.log_error(f"Остановка по таймауту: отброшено обновлений {dropped_updates}, "
+                         f"фоновых задач {dropped_tasks}, прервано обработчиков {interrupted_handlers}")
+    else:
+        logger.log_info("Все обновления и фоновые задачи обработаны перед остановкой")
+    logger.flush()
+    application.stop_running()
+
+
+def install_stop_signals(application):
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, lambda: run_in_background(graceful_stop(application)))
+        except NotImplementedError:
+            logger.log_error(f"Не удалось установить обработчик сигнала {sig.name}")
+
+
+async def post_shutdown(application):
+    watchdog.stop()
+    logger.log_info(f"Метрики бота: {metrics.snapshot()}")
+    logger.flush()
+    if update_recorder is not None:
+        update_recorder.flush()
+    for family, stats in bot_cache.stats().items():
+        logger.log_info(f"Кэш {family}: {stats}")
+
+
+async def send_when_idle(application, chat_id, text, **kwargs):
+    if load_monitor.overloaded:
+        metrics.increment("deferred_admin_messages")
+    # Уровень меняет только admit_update(): здесь он лишь проверяется, иначе admit_update() не заметит
+    # возврата к NORMAL и не включит отладочный лог обратно.
+    while load_monitor.level_for(application.update_queue.qsize()) > NORMAL \
+            and not application.bot_data.get("stopping"):
+        await asyncio.sleep(DEFERRED_SEND_POLL_INTERVAL)
+    await application.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+
+
+async def send_admin_alert(application, admin_chat_id, error_message: str):
+    try:
+        await send_when_idle(application, admin_chat_id, f"❗️ Оповещение об ошибке:\n{error_message}")
+    except Exception as e:
+        logger.log_error(f"Ошибка отправки оповещения админу: {e}")
+
 
 async def notify_admin_error(error_message: str, context: ContextTypes.DEFAULT_TYPE):
     admin_chat_id = settings.ADMIN_CHAT_ID
     if not admin_chat_id:
         logger.log_error("ADMIN_CHAT_ID не настроен для отправки оповещений.")
         return
-    try:
-        await context.bot.send_message(chat_id=admin_chat_id, text=f"❗️ Оповещение об ошибке:\n{error_message}")
-    except Exception as e:
-        logger.log_error(f"Ошибка отправки оповещения админу: {e}")
+    run_in_background(send_admin_alert(context.application, admin_chat_id, error_message))
+
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    update_recorder.record(update.to_dict())
 
 
-def run_bot():
-    app = ApplicationBuilder().token(settings.TELEGRAM_TOKEN).build()
+def build_application(builder, record_updates=True):
+    app = builder.build()
+    if record_updates and update_recorder is not None:
+        app.add_handler(TypeHandler(Update, record_update), group=RECORD_UPDATE_GROUP)
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("quiz", quiz_command))
-    app.add_handler(CallbackQueryHandler(start_quiz_callback, pattern="^start_quiz$"))
-    app.add_handler(CallbackQueryHandler(quiz_callback, pattern="^quiz:"))
     app.add_handler(CommandHandler("guardianship", guardianship_command))
 
     contact_handler = ConversationHandler(
         entry_points=[
-            CallbackQueryHandler(contact_guardianship_callback, pattern="^contact_guardianship:"),
+            CallbackQueryHandler(contact_guardianship_callback, pattern=callback_tag_pattern(CONTACT_GUARDIANSHIP)),
             CommandHandler("contact", contact_command)
         ],
         states={
             CONTACT: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_contact_message)]
         },
-        fallbacks=[CommandHandler("cancel", cancel_contact)]
+        fallbacks=[CommandHandler("cancel", cancel_contact)],
+        conversation_timeout=settings.BOT_CONVERSATION_TIMEOUT
     )
     app.add_handler(contact_handler)
 
@@ -446,11 +752,24 @@ def run_bot():
         states={
             FEEDBACK: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_feedback)]
         },
-        fallbacks=[CommandHandler("cancel", cancel_feedback)]
+        fallbacks=[CommandHandler("cancel", cancel_feedback)],
+        conversation_timeout=settings.BOT_CONVERSATION_TIMEOUT
     )
     app.add_handler(feedback_handler)
+    app.add_handler(CallbackQueryHandler(callback_dispatcher))
+    app.add_handler(TypeHandler(Update, admit_update), group=BEFORE_UPDATE_GROUP)
+    app.add_handler(TypeHandler(Update, finish_update), group=AFTER_UPDATE_GROUP)
+    return app
 
+
+def run_bot(started_at=None):
+    app = build_application(
+        ApplicationBuilder().token(settings.TELEGRAM_TOKEN)
+        .request(WatchedRequest(connection_pool_size=256)).get_updates_request(WatchedRequest())
+    )
+    app.bot_data["started_at"] = started_at if started_at is not None else time.monotonic()
     app.post_init = post_init
+    app.post_shutdown = post_shutdown
 
     logger.log_info("Запуск бота")
-    app.run_polling()
+    app.run_polling(stop_signals=None)
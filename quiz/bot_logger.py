@@ -1,5 +1,6 @@
 import logging
 from logging.handlers import RotatingFileHandler
+from .log_store import DatabaseLogHandler
 
 class BotLogger:
     def __init__(self, log_file):
@@ -11,11 +12,27 @@ class BotLogger:
         file_handler.setFormatter(formatter)
         self.logger.addHandler(file_handler)
 
-    def log_info(self, message):
-        self.logger.info(message)
+        store_handler = DatabaseLogHandler.from_settings()
+        if store_handler is not None:
+            self.logger.addHandler(store_handler)
 
-    def log_error(self, message):
-        self.logger.error(message)
+    def log_info(self, message, **fields):
+        self.logger.info(message, extra=fields)
 
-    def log_debug(self, message):
-        self.logger.debug(message)
+    def log_error(self, message, **fields):
+        self.logger.error(message, extra=fields)
+
+    def log_debug(self, message, **fields):
+        self.logger.debug(message, extra=fields)
+
+    def set_debug_enabled(self, enabled):
+        self.logger.setLevel(logging.DEBUG if enabled else logging.INFO)
+
+    def disable_store(self):
+        for handler in [h for h in self.logger.handlers if isinstance(h, DatabaseLogHandler)]:
+            handler.flush()
+            self.logger.removeHandler(handler)
+
+    def flush(self):
+        for handler in self.logger.handlers:
+            handler.flush()
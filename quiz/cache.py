@@ -0,0 +1,218 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+
+VERSION_KEY_PREFIX = "bot_cache_version"
+_MISSING = object()
+
+
+def make_key(family, key):
+    if isinstance(key, tuple):
+        key = "_".join(str(part) for part in key)
+    return f"{family}:{key}"
+
+
+class FamilyStats:
+    def __init__(self):
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+
+    @property
+    def requests(self):
+        return self.l1_hits + self.l2_hits + self.misses
+
+    @property
+    def hit_rate(self):
+        requests = self.requests
+        return (self.l1_hits + self.l2_hits) / requests if requests else 0.0
+
+    def as_dict(self):
+        return {
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+
+class TwoTierCache:
+    """
+    L1 — ограниченный LRU живых объектов в памяти процесса (без pickle), L2 — общий
+    Django-бэкенд из CACHES. Когерентность обеспечивается версией семейства ключей в общем
+    бэкенде version_alias: invalidate() увеличивает версию, и все процессы перестают видеть
+    старые записи не позже чем через version_check_interval секунд. Версии хранятся отдельно
+    от записей, чтобы вытеснение записей из L2 не сбросило версию к значению, под которым
+    ещё лежат устаревшие записи.
+    """
+
+    def __init__(self, alias="default", timeout=300, l1_max_entries=1024, l1_timeout=60,
+                 version_check_interval=5, version_alias=None):
+        self.alias = alias
+        self.version_alias = version_alias or alias
+        self.timeout = timeout
+        self.l1_max_entries = l1_max_entries
+        self.l1_timeout = l1_timeout
+        self.version_check_interval = version_check_interval
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, "BOT_CACHE", {})
+        return cls(
+            alias=options.get("ALIAS", "default"),
+            timeout=options.get("TIMEOUT", 300),
+            l1_max_entries=options.get("L1_MAX_ENTRIES", 1024),
+            l1_timeout=options.get("L1_TIMEOUT", 60),
+            version_check_interval=options.get("VERSION_CHECK_INTERVAL", 5),
+            version_alias=options.get("VERSION_ALIAS"),
+        )
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    @property
+    def versions(self):
+        return caches[self.version_alias]
+
+    def _family_stats(self, family):
+        stats = self._stats.get(family)
+        if stats is None:
+            stats = self._stats[family] = FamilyStats()
+        return stats
+
+    def _fresh_version(self, family):
+        cached = self._versions.get(family)
+        if cached is not None and time.monotonic() - cached[1] < self.version_check_interval:
+            return cached[0]
+        return None
+
+    def _version(self, family):
+        version = self._fresh_version(family)
+        if version is not None:
+            return version
+        version_key = f"{VERSION_KEY_PREFIX}:{family}"
+        version = self.versions.get(version_key)
+        if version is None:
+            self.versions.add(version_key, 1, timeout=None)
+            version = self.versions.get(version_key, 1)
+        self._versions[family] = (version, time.monotonic())
+        return version
+
+    async def _aversion(self, family):
+        version = self._fresh_version(family)
+        if version is not None:
+            return version
+        version_key = f"{VERSION_KEY_PREFIX}:{family}"
+        version = await self.versions.aget(version_key)
+        if version is None:
+            await self.versions.aadd(version_key, 1, timeout=None)
+            version = await self.versions.aget(version_key, 1)
+        self._versions[family] = (version, time.monotonic())
+        return version
+
+    def _l1_get(self, l1_key, version):
+        with self._lock:
+            entry = self._entries.get(l1_key)
+            if entry is None:
+                return _MISSING
+            value, expires_at, entry_version = entry
+            if entry_version != version or expires_at < time.monotonic():
+                del self._entries[l1_key]
+                return _MISSING
+            self._entries.move_to_end(l1_key)
+            return value
+
+    def _l1_set(self, l1_key, value, version):
+        with self._lock:
+            self._entries[l1_key] = (value, time.monotonic() + self.l1_timeout, version)
+            self._entries.move_to_end(l1_key)
+            while len(self._entries) > self.l1_max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, family, key, default=None, l1=True):
+        """
+        l1=False читает только L2: так запись, перезаписанная через set(..., l1=False) в другом
+        процессе, видна сразу, без смены версии всего семейства.
+        """
+        stats = self._family_stats(family)
+        version = self._version(family)
+        l1_key = (family, key)
+        if l1:
+            value = self._l1_get(l1_key, version)
+            if value is not _MISSING:
+                stats.l1_hits += 1
+                return value
+        value = self.backend.get(make_key(family, key), _MISSING, version=version)
+        if value is _MISSING:
+            stats.misses += 1
+            return default
+        stats.l2_hits += 1
+        if l1:
+            self._l1_set(l1_key, value, version)
+        return value
+
+    def set(self, family, key, value, timeout=None, l1=True):
+        version = self._version(family)
+        self.backend.set(make_key(family, key), value, timeout=timeout or self.timeout, version=version)
+        if l1:
+            self._l1_set((family, key), value, version)
+
+    def get_or_set(self, family, key, loader, timeout=None):
+        value = self.get(family, key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(family, key, value, timeout)
+        return value
+
+    async def aget(self, family, key, default=None):
+        stats = self._family_stats(family)
+        version = await self._aversion(family)
+        l1_key = (family, key)
+        value = self._l1_get(l1_key, version)
+        if value is not _MISSING:
+            stats.l1_hits += 1
+            return value
+        value = await self.backend.aget(make_key(family, key), _MISSING, version=version)
+        if value is _MISSING:
+            stats.misses += 1
+            return default
+        stats.l2_hits += 1
+        self._l1_set(l1_key, value, version)
+        return value
+
+    async def aset(self, family, key, value, timeout=None):
+        version = await self._aversion(family)
+        await self.backend.aset(make_key(family, key), value, timeout=timeout or self.timeout, version=version)
+        self._l1_set((family, key), value, version)
+
+    async def aget_or_set(self, family, key, loader, timeout=None):
+        value = await self.aget(family, key, _MISSING)
+        if value is _MISSING:
+            value = await loader()
+            await self.aset(family, key, value, timeout)
+        return value
+
+    def invalidate(self, family):
+        version_key = f"{VERSION_KEY_PREFIX}:{family}"
+        try:
+            version = self.versions.incr(version_key)
+        except ValueError:
+            self.versions.add(version_key, 2, timeout=None)
+            version = self.versions.get(version_key, 2)
+        self._versions[family] = (version, time.monotonic())
+        with self._lock:
+            for l1_key in [k for k in self._entries if k[0] == family]:
+                del self._entries[l1_key]
+
+    def stats(self):
+        return {family: stats.as_dict() for family, stats in self._stats.items()}
+
+
+bot_cache = TwoTierCache.from_settings()
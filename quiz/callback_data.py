@@ -0,0 +1,80 @@
+import base64
+import binascii
+
+CODEC_VERSION = 1
+MAX_CALLBACK_DATA_LENGTH = 64
+
+START_QUIZ = 1
+QUIZ_ANSWER = 2
+CONTACT_GUARDIANSHIP = 3
+
+LEGACY_START_QUIZ = "start_quiz"
+LEGACY_QUIZ_PREFIX = "quiz:"
+LEGACY_CONTACT_GUARDIANSHIP_PREFIX = "contact_guardianship:"
+
+
+def _write_varint(value: int, out: bytearray):
+    if value < 0:
+        raise ValueError(f"Отрицательное значение в callback data: {value}")
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varints(payload: bytes, offset: int):
+    fields = []
+    value = shift = 0
+    for byte in payload[offset:]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            fields.append(value)
+            value = shift = 0
+    if shift:
+        raise ValueError("Обрезанное значение varint в callback data")
+    return tuple(fields)
+
+
+def encode_callback_data(tag: int, *fields: int) -> str:
+    payload = bytearray((CODEC_VERSION, tag))
+    for field in fields:
+        _write_varint(field, payload)
+    data = base64.urlsafe_b64encode(payload).rstrip(b"=").decode("ascii")
+    if len(data) > MAX_CALLBACK_DATA_LENGTH:
+        raise ValueError(f"Callback data длиннее {MAX_CALLBACK_DATA_LENGTH} байт: {data}")
+    return data
+
+
+def _decode_legacy(data: str):
+    if data == LEGACY_START_QUIZ:
+        return START_QUIZ, ()
+    if data.startswith(LEGACY_QUIZ_PREFIX):
+        return QUIZ_ANSWER, tuple(int(part) for part in data[len(LEGACY_QUIZ_PREFIX):].split("|"))
+    if data.startswith(LEGACY_CONTACT_GUARDIANSHIP_PREFIX):
+        return CONTACT_GUARDIANSHIP, (int(data[len(LEGACY_CONTACT_GUARDIANSHIP_PREFIX):]),)
+    return None
+
+
+def decode_callback_data(data: str):
+    if not data:
+        return None
+    try:
+        legacy = _decode_legacy(data)
+        if legacy is not None:
+            return legacy
+        payload = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+        if len(payload) < 2 or payload[0] != CODEC_VERSION:
+            return None
+        return payload[1], _read_varints(payload, 2)
+    except (ValueError, binascii.Error):
+        return None
+
+
+def callback_tag_pattern(tag: int):
+    def pattern(data):
+        decoded = decode_callback_data(data) if isinstance(data, str) else None
+        return decoded is not None and decoded[0] == tag
+
+    return pattern
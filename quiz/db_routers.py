@@ -0,0 +1,52 @@
+from django.db import DEFAULT_DB_ALIAS
+
+SESSION_DATABASE = "sessions"
+SESSION_DATA_APPS = {"sessions", "django_cache"}
+SESSION_DATA_MODELS = {
+    ("quiz", "userquizanswer"),
+    ("quiz", "contactmessage"),
+}
+LOG_DATABASE = "logs"
+LOG_DATA_MODELS = {
+    ("quiz", "botlogrecord"),
+}
+
+
+def is_session_data(app_label, model_name=None):
+    return app_label in SESSION_DATA_APPS or (app_label, model_name) in SESSION_DATA_MODELS
+
+
+def is_log_data(app_label, model_name=None):
+    return (app_label, model_name) in LOG_DATA_MODELS
+
+
+def database_for(app_label, model_name=None):
+    if is_log_data(app_label, model_name):
+        return LOG_DATABASE
+    if is_session_data(app_label, model_name):
+        return SESSION_DATABASE
+    return DEFAULT_DB_ALIAS
+
+
+class SessionDataRouter:
+    """
+    Часто изменяемые данные (ответы пользователей, сообщения, сессии, кэш) живут в отдельной
+    базе SESSION_DATABASE, лог бота — в своей базе LOG_DATABASE, чтобы его запись не ждала
+    блокировки SQLite вместе с ответами, контент викторины — в default. Связи между базами
+    не имеют ограничений внешних ключей, поэтому чтение всегда направляется явно.
+    """
+
+    def _database_for(self, model):
+        return database_for(model._meta.app_label, model._meta.model_name)
+
+    def db_for_read(self, model, **hints):
+        return self._database_for(model)
+
+    def db_for_write(self, model, **hints):
+        return self._database_for(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == database_for(app_label, model_name)
@@ -0,0 +1,52 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from telegram.request import BaseRequest
+
+FAKE_BOT_USER = {"id": 1, "is_bot": True, "first_name": "Moscow Zoo", "username": "moscow_zoo_replay_bot"}
+MESSAGE_ENDPOINTS = ("sendMessage", "sendPhoto", "editMessageText", "editMessageCaption")
+
+
+class FakeRequest(BaseRequest):
+    """
+    Запросы к Bot API без сети: на каждый метод возвращается правдоподобный ответ,
+    вызовы считаются по методам, задержка API имитируется через api_latency.
+    """
+
+    def __init__(self, api_latency=0.0):
+        self.api_latency = api_latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _build_result(self, endpoint, parameters):
+        if endpoint == "getMe":
+            return FAKE_BOT_USER
+        if endpoint == "getUpdates":
+            return []
+        if endpoint in MESSAGE_ENDPOINTS:
+            self._message_id += 1
+            return {
+                "message_id": parameters.get("message_id", self._message_id),
+                "date": int(time.time()),
+                "chat": {"id": parameters.get("chat_id", 0), "type": "private"},
+                "from": FAKE_BOT_USER,
+                "text": parameters.get("text", ""),
+            }
+        return True
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+        parameters = request_data.parameters if request_data else {}
+        payload = {"ok": True, "result": self._build_result(endpoint, parameters)}
+        return 200, json.dumps(payload).encode()
@@ -0,0 +1,66 @@
+import time
+from django.conf import settings
+
+NORMAL, SOFT, HARD = range(3)
+LEVEL_NAMES = {NORMAL: "normal", SOFT: "soft", HARD: "hard"}
+
+
+class LoadMonitor:
+    """
+    Уровень нагрузки по глубине очереди обновлений и сглаженной задержке обработчиков.
+    SOFT — отказываем в новых викторинах и откладываем неинтерактивную работу,
+    HARD — дополнительно отвечаем на все callback-запросы подсказкой «бот занят».
+    """
+
+    def __init__(self, soft_queue_depth=50, hard_queue_depth=200, soft_latency=1.0, hard_latency=3.0,
+                 latency_window=10.0, smoothing=0.2):
+        self.soft_queue_depth = soft_queue_depth
+        self.hard_queue_depth = hard_queue_depth
+        self.soft_latency = soft_latency
+        self.hard_latency = hard_latency
+        self.latency_window = latency_window
+        self.smoothing = smoothing
+        self.latency = 0.0
+        self.latency_observed_at = 0.0
+        self.queue_depth = 0
+        self.level = NORMAL
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, "BOT_LOAD_SHEDDING", {})
+        return cls(
+            soft_queue_depth=options.get("SOFT_QUEUE_DEPTH", 50),
+            hard_queue_depth=options.get("HARD_QUEUE_DEPTH", 200),
+            soft_latency=options.get("SOFT_LATENCY", 1.0),
+            hard_latency=options.get("HARD_LATENCY", 3.0),
+            latency_window=options.get("LATENCY_WINDOW", 10.0),
+        )
+
+    def record_latency(self, seconds):
+        self.latency += self.smoothing * (seconds - self.latency)
+        self.latency_observed_at = time.monotonic()
+
+    def current_latency(self):
+        if time.monotonic() - self.latency_observed_at > self.latency_window:
+            return 0.0
+        return self.latency
+
+    def level_for(self, queue_depth):
+        latency = self.current_latency()
+        if queue_depth >= self.hard_queue_depth or latency >= self.hard_latency:
+            return HARD
+        if queue_depth >= self.soft_queue_depth or latency >= self.soft_latency:
+            return SOFT
+        return NORMAL
+
+    def update_level(self, queue_depth):
+        self.queue_depth = queue_depth
+        self.level = self.level_for(queue_depth)
+        return self.level
+
+    @property
+    def overloaded(self):
+        return self.level > NORMAL
+
+
+load_monitor = LoadMonitor.from_settings()
@@ -0,0 +1,135 @@
+import logging
+import queue
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connections, router
+
+LOG_SEARCH_TABLE = "quiz_botlogrecord_fts"
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class DatabaseLogHandler(logging.Handler):
+    """
+    Пишет записи лога в BotLogRecord. emit() только кладёт запись в очередь, а отдельный поток
+    сохраняет их пачками и удаляет записи старше retention_days, поэтому цикл событий бота
+    не ждёт базу данных. При переполнении очереди записи отбрасываются и считаются в dropped.
+    """
+
+    def __init__(self, level=logging.INFO, batch_size=200, flush_interval=2.0, retention_days=30,
+                 prune_interval=3600, max_queue=10000):
+        super().__init__(level)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pruned_at = None
+        self._thread = threading.Thread(target=self._run, name="log_store", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, "BOT_LOG_STORE", {})
+        if not options.get("ENABLED", True):
+            return None
+        return cls(
+            level=logging.getLevelName(options.get("LEVEL", "INFO")),
+            batch_size=options.get("BATCH_SIZE", 200),
+            flush_interval=options.get("FLUSH_INTERVAL", 2.0),
+            retention_days=options.get("RETENTION_DAYS", 30),
+            prune_interval=options.get("PRUNE_INTERVAL", 3600),
+        )
+
+    def emit(self, record):
+        message = record.getMessage()
+        if record.exc_info:
+            message = f"{message}\n{''.join(traceback.format_exception(*record.exc_info))}"
+        try:
+            self._queue.put_nowait((
+                record.created,
+                record.levelno,
+                getattr(record, "user_id", None),
+                getattr(record, "quiz_id", None),
+                getattr(record, "event", ""),
+                message,
+            ))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        if not self._thread.is_alive() or threading.current_thread() is self._thread:
+            return
+        request = _FlushRequest()
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            return
+        request.done.wait(timeout)
+
+    def _run(self):
+        while True:
+            rows = []
+            flush_requests = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size and not flush_requests:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if isinstance(item, _FlushRequest):
+                    flush_requests.append(item)
+                else:
+                    rows.append(item)
+            try:
+                if rows:
+                    self._write(rows)
+                self._prune_if_due()
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+            finally:
+                for request in flush_requests:
+                    request.done.set()
+
+    def _write(self, rows):
+        from .models import BotLogRecord
+        BotLogRecord.objects.bulk_create([
+            BotLogRecord(
+                created_at=datetime.fromtimestamp(created, tz=dt_timezone.utc),
+                level=level,
+                telegram_user_id=user_id,
+                quiz_id=quiz_id,
+                event=event,
+                message=message,
+            )
+            for created, level, user_id, quiz_id, event, message in rows
+        ])
+
+    def _prune_if_due(self):
+        now = time.monotonic()
+        if self._pruned_at is not None and now - self._pruned_at < self.prune_interval:
+            return
+        self._pruned_at = now
+        prune_log_records(self.retention_days)
+
+
+def prune_log_records(retention_days):
+    from .models import BotLogRecord
+    cutoff = datetime.now(dt_timezone.utc) - timedelta(days=retention_days)
+    return BotLogRecord.objects.filter(created_at__lt=cutoff).delete()[0]
+
+
+def supports_full_text_search(model):
+    return connections[router.db_for_read(model)].vendor == "sqlite"
+
+
+def build_match_query(search_term):
+    return " ".join('"{}"'.format(token.replace('"', '""')) for token in search_term.split())
@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from quiz.analysis import QuizTooLargeError, analyze_quiz_balance, store_quiz_balance
+from quiz.models import Quiz
+
+
+class Command(BaseCommand):
+    help = ("Точное распределение результатов викторины по всем комбинациям ответов "
+            "с учётом ничьих, как в calculate_result")
+
+    def add_arguments(self, parser):
+        parser.add_argument("quiz_id", nargs="?", type=int,
+                            help="ID викторины, по умолчанию активная; результат показывается в админке")
+        parser.add_argument("--max-states", type=int, default=None,
+                            help="Прервать расчёт, если число различных состояний превысит значение")
+
+    def handle(self, *args, **options):
+        if options["quiz_id"] is None:
+            quiz = Quiz.objects.filter(is_active=True).first()
+            if quiz is None:
+                raise CommandError("Нет активной викторины")
+        else:
+            quiz = Quiz.objects.filter(pk=options["quiz_id"]).first()
+            if quiz is None:
+                raise CommandError(f"Викторина {options['quiz_id']} не найдена")
+
+        started_at = time.monotonic()
+        try:
+            balance = analyze_quiz_balance(quiz, max_states=options["max_states"])
+        except QuizTooLargeError as e:
+            raise CommandError(str(e))
+        elapsed = time.monotonic() - started_at
+        store_quiz_balance(quiz, balance)
+
+        self.stdout.write(f"Викторина «{quiz.name}»: {balance.total_paths} комбинаций ответов, "
+                          f"расчёт {elapsed:.2f} с")
+        for question in balance.skipped_questions:
+            self.stdout.write(self.style.WARNING(f"Вопрос без ответов пропущен: {question.text}"))
+        for row in balance.rows():
+            flags = []
+            if row["unreachable"]:
+                flags.append("недостижимо")
+            if row["dominant"]:
+                flags.append("доминирует")
+            line = (f"{row['animal'].name:<30} {row['percent']:8.3f}%  "
+                    f"{row['paths']:16.1f}  {', '.join(flags)}")
+            self.stdout.write(self.style.WARNING(line) if flags else line)
+        if balance.no_result_probability:
+            self.stdout.write(self.style.WARNING(
+                f"Без результата: {balance.no_result_percent:.3f}%"))
@@ -0,0 +1,25 @@
+import timeit
+from django.core.management.base import BaseCommand
+from quiz.callback_data import QUIZ_ANSWER, encode_callback_data, decode_callback_data
+
+
+class Command(BaseCommand):
+    help = "Микро-бенчмарк кодирования и разбора callback data"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=100000, help="Количество итераций")
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        for fields in [(1, 12, 345), (1234, 56789, 1234567), (2 ** 31, 2 ** 40, 2 ** 50)]:
+            encoded = encode_callback_data(QUIZ_ANSWER, *fields)
+            legacy = "quiz:{}|{}|{}".format(*fields)
+            encode_time = timeit.timeit(lambda: encode_callback_data(QUIZ_ANSWER, *fields), number=number)
+            decode_time = timeit.timeit(lambda: decode_callback_data(encoded), number=number)
+            legacy_decode_time = timeit.timeit(lambda: decode_callback_data(legacy), number=number)
+            self.stdout.write(
+                f"{fields}: {len(encoded)} байт (текстовый формат {len(legacy)}), "
+                f"кодирование {encode_time / number * 1e6:.2f} мкс, "
+                f"разбор {decode_time / number * 1e6:.2f} мкс, "
+                f"разбор текстового формата {legacy_decode_time / number * 1e6:.2f} мкс"
+            )
@@ -0,0 +1,174 @@
+import asyncio
+import random
+import time
+from asgiref.sync import sync_to_async, async_to_sync
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from quiz import repository
+from quiz.models import Quiz, UserQuizAnswer, Question, Animal
+
+BENCHMARK_USER_ID = -1
+
+# Базовый вариант — помощники доступа к данным из quiz/bot.py до перехода на bot_cache и асинхронный ORM,
+# скопированные без изменений (кроме префикса legacy_): sync_to_async вокруг синхронного ORM и кэша Django.
+CACHE_TIMEOUT = 300
+
+
+@sync_to_async
+def legacy_get_active_quiz():
+    cache_key = "active_quiz"
+    quiz = cache.get(cache_key)
+    if quiz is None:
+        quiz = Quiz.objects.filter(is_active=True).first()
+        cache.set(cache_key, quiz, timeout=CACHE_TIMEOUT)
+    return quiz
+
+
+@sync_to_async
+def legacy_cleanup_user_answers(user_id, quiz_id):
+    UserQuizAnswer.objects.filter(telegram_user_id=user_id, quiz_id=quiz_id).delete()
+
+
+@sync_to_async
+def legacy_get_first_question(quiz):
+    cache_key = f"first_question_{quiz.id}"
+    first_question = cache.get(cache_key)
+    if first_question is None:
+        qq = quiz.quiz_questions.order_by("order").first()
+        first_question = qq.question if qq else None
+        cache.set(cache_key, first_question, timeout=CACHE_TIMEOUT)
+    return first_question
+
+
+@sync_to_async
+def legacy_get_answers_for_question(question):
+    cache_key = f"answers_for_question_{question.id}"
+    answers = cache.get(cache_key)
+    if answers is None:
+        answers = list(question.answers.all())
+        cache.set(cache_key, answers, timeout=CACHE_TIMEOUT)
+    return answers
+
+
+@sync_to_async
+def legacy_store_user_answer(user_id, quiz_id, question_id, answer_id):
+    return UserQuizAnswer.objects.create(
+        telegram_user_id=user_id,
+        quiz_id=quiz_id,
+        question_id=question_id,
+        answer_id=answer_id
+    )
+
+
+@sync_to_async
+def legacy_get_next_question(quiz, question):
+    cache_key = f"next_question_{quiz.id}_{question.id}"
+    next_question = cache.get(cache_key)
+    if next_question is not None:
+        return next_question
+
+    current_qq = quiz.quiz_questions.filter(question=question).first()
+    if not current_qq:
+        return None
+
+    next_qq = quiz.quiz_questions.filter(order__gt=current_qq.order).order_by("order").first()
+    next_question = next_qq.question if next_qq else None
+    cache.set(cache_key, next_question, timeout=CACHE_TIMEOUT)
+    return next_question
+
+
+@sync_to_async
+def legacy_get_animal_by_id(animal_id):
+    cache_key = f"animal_{animal_id}"
+    animal = cache.get(cache_key)
+    if animal is None:
+        animal = Animal.objects.filter(id=animal_id).first()
+        cache.set(cache_key, animal, timeout=CACHE_TIMEOUT)
+    return animal
+
+
+@sync_to_async
+def legacy_calculate_result(user_id, quiz_id):
+    user_answers = UserQuizAnswer.objects.filter(telegram_user_id=user_id, quiz_id=quiz_id)
+    if not user_answers.exists():
+        return None
+
+    counts = {}
+    for ua in user_answers:
+        for animal in ua.answer.animals.all():
+            counts[animal.id] = counts.get(animal.id, 0) + 1
+
+    if not counts:
+        return None
+
+    max_count = max(counts.values())
+    max_ids: list[int] = [aid for aid, cnt in counts.items() if cnt == max_count]
+    chosen_id = random.choice(max_ids)
+    return async_to_sync(legacy_get_animal_by_id)(chosen_id)
+
+
+async def legacy_get_question_keyboard(question):
+    # Раньше раскладку кнопок строил show_question() из списка ответов.
+    return repository.build_keyboard_layout(await legacy_get_answers_for_question(question))
+
+
+LEGACY_PATH = {
+    "get_active_quiz": legacy_get_active_quiz,
+    "get_first_question": legacy_get_first_question,
+    "get_question_keyboard": legacy_get_question_keyboard,
+    "store_user_answer": legacy_store_user_answer,
+    # callback-обработчик викторины загружал викторину и вопрос при каждом ответе без кэша.
+    "get_quiz": lambda quiz_id: sync_to_async(Quiz.objects.get)(pk=quiz_id),
+    "get_question": lambda question_id: sync_to_async(Question.objects.get)(pk=question_id),
+    "get_next_question": legacy_get_next_question,
+    "calculate_result": legacy_calculate_result,
+    "cleanup_user_answers": legacy_cleanup_user_answers,
+}
+ASYNC_PATH = {name: getattr(repository, name) for name in LEGACY_PATH}
+
+
+async def play_quiz(path, timings):
+    async def call(name, *args):
+        started_at = time.perf_counter()
+        result = await path[name](*args)
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started_at
+        return result
+
+    quiz = await call("get_active_quiz")
+    question = await call("get_first_question", quiz)
+    while question is not None:
+        keyboard = await call("get_question_keyboard", question)
+        answer_id = keyboard[0][0][1]
+        await call("store_user_answer", BENCHMARK_USER_ID, quiz.id, question.id, answer_id)
+        quiz = await call("get_quiz", quiz.id)
+        question = await call("get_question", question.id)
+        question = await call("get_next_question", quiz, question)
+    animal = await call("calculate_result", BENCHMARK_USER_ID, quiz.id)
+    await call("cleanup_user_answers", BENCHMARK_USER_ID, quiz.id)
+    return animal
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает исходный доступ к данным бота (sync_to_async и кэш Django) с асинхронным репозиторием "
+            "на полном прохождении активной викторины")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=50, help="Количество прохождений викторины")
+
+    def handle(self, *args, **options):
+        if not Quiz.objects.filter(is_active=True).exists():
+            raise CommandError("Нет активной викторины")
+        asyncio.run(self.run_benchmark(options["number"]))
+
+    async def run_benchmark(self, number):
+        await repository.warm_up_caches()
+        for title, path in (("исходный sync_to_async", LEGACY_PATH), ("асинхронный репозиторий", ASYNC_PATH)):
+            await play_quiz(path, {})
+            timings = {}
+            started_at = time.perf_counter()
+            for _ in range(number):
+                await play_quiz(path, timings)
+            elapsed = time.perf_counter() - started_at
+            self.stdout.write(f"{title}: {elapsed / number * 1000:.2f} мс на прохождение викторины")
+            for name, total in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+                self.stdout.write(f"  {name:<24} {total / number * 1000:8.3f} мс")
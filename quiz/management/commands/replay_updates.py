@@ -0,0 +1,133 @@
+import asyncio
+import time
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def remap_session_nonce(update_data, app, nonce_map):
+    from quiz.callback_data import QUIZ_ANSWER, decode_callback_data, encode_callback_data
+    callback_query = update_data.get("callback_query")
+    decoded = decode_callback_data(callback_query.get("data")) if callback_query else None
+    if not decoded or decoded[0] != QUIZ_ANSWER or len(decoded[1]) != 5:
+        return
+    user_id = callback_query["from"]["id"]
+    quiz_id, question_id, answer_id, nonce, step = decoded[1]
+    if (user_id, nonce) not in nonce_map:
+        session = app.user_data.get(user_id, {}).get("quiz_session")
+        if not session:
+            return
+        nonce_map[(user_id, nonce)] = session["nonce"]
+    callback_query["data"] = encode_callback_data(
+        QUIZ_ANSWER, quiz_id, question_id, answer_id, nonce_map[(user_id, nonce)], step)
+
+
+class Command(BaseCommand):
+    help = ("Воспроизводит записанные обновления через обработчики бота с фиктивным Bot API "
+            "и выводит пропускную способность и задержки. Сообщения админу не отправляются, лог бота "
+            "не пишется в базу данных, а созданные ответы и сообщения пользователей удаляются после воспроизведения.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", help="JSONL-файлы записи (включая ротированные)")
+        parser.add_argument("--speed", type=float, default=1.0,
+                            help="Множитель скорости воспроизведения, 0 — максимальная скорость")
+        parser.add_argument("--api-latency", type=float, default=0.0,
+                            help="Имитируемая задержка одного вызова Bot API, мс")
+        parser.add_argument("--keep-data", action="store_true",
+                            help="Не удалять созданные ответы и сообщения пользователей (для копии базы данных)")
+
+    def handle(self, *args, **options):
+        from django.db.models.signals import post_save
+        from django.test.utils import override_settings
+        from quiz.bot import logger
+        from quiz.models import UserQuizAnswer, ContactMessage
+        from quiz.update_recorder import read_recordings
+        try:
+            records = sorted(read_recordings(options["files"]), key=lambda record: record["ts"])
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Не удалось прочитать запись: {e}")
+        if not records:
+            raise CommandError("Запись не содержит обновлений")
+        if options["speed"] < 0:
+            raise CommandError("--speed не может быть отрицательным")
+
+        # Воспроизведение идёт против рабочей базы, поэтому пересылка и оповещения админу выключены,
+        # лог бота пишется только в файл, а созданные строки удаляются после воспроизведения.
+        logger.disable_store()
+        created_rows = defaultdict(set)
+
+        def collect_created(sender, instance, created=False, **kwargs):
+            if created:
+                created_rows[sender].add(instance.pk)
+
+        for model in (UserQuizAnswer, ContactMessage):
+            post_save.connect(collect_created, sender=model, weak=False)
+        try:
+            with override_settings(ADMIN_CHAT_ID=""):
+                asyncio.run(self.replay(records, options["speed"], options["api_latency"] / 1000))
+        finally:
+            for model in (UserQuizAnswer, ContactMessage):
+                post_save.disconnect(collect_created, sender=model)
+            if not options["keep_data"]:
+                for model, pks in created_rows.items():
+                    deleted, _ = model.objects.filter(pk__in=pks).delete()
+                    self.stdout.write(f"Удалено строк {model.__name__}, созданных при воспроизведении: {deleted}")
+
+    async def replay(self, records, speed, api_latency):
+        from django.conf import settings
+        from telegram import Update
+        from telegram.ext import ApplicationBuilder
+        from quiz.background import drain
+        from quiz.bot import build_application
+        from quiz.repository import warm_up_caches
+        from quiz.fake_bot import FakeRequest
+
+        request = FakeRequest(api_latency=api_latency)
+        app = build_application(
+            ApplicationBuilder().token("0:replay").request(request).get_updates_request(FakeRequest()).updater(None),
+            record_updates=False
+        )
+        await app.initialize()
+        await warm_up_caches()
+
+        latencies = []
+        lags = []
+        nonce_map = {}
+        first_ts = records[0]["ts"]
+        started_at = time.monotonic()
+        for record in records:
+            if speed:
+                scheduled_at = started_at + (record["ts"] - first_ts) / speed
+                delay = scheduled_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                lags.append(max(0.0, -delay))
+            remap_session_nonce(record["update"], app, nonce_map)
+            update = Update.de_json(record["update"], app.bot)
+            handling_started = time.monotonic()
+            await app.process_update(update)
+            latencies.append(time.monotonic() - handling_started)
+        elapsed = time.monotonic() - started_at
+        await drain(settings.BOT_SHUTDOWN_TIMEOUT)
+        await app.shutdown()
+
+        latencies.sort()
+        self.stdout.write(f"Обновлений: {len(records)} за {elapsed:.2f} с, "
+                          f"{len(records) / elapsed if elapsed else 0:.1f} обновлений/с")
+        self.stdout.write("Задержка обработки, мс: " + ", ".join(
+            f"{name} {percentile(latencies, fraction) * 1000:.2f}"
+            for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+        ))
+        if lags:
+            lags.sort()
+            self.stdout.write(f"Отставание от расписания, мс: p95 {percentile(lags, 0.95) * 1000:.2f}, "
+                              f"max {lags[-1] * 1000:.2f}")
+        self.stdout.write("Вызовы Bot API: " + ", ".join(
+            f"{endpoint} {count}" for endpoint, count in request.calls.most_common()
+        ))
@@ -1,8 +1,11 @@
+import time
 from django.core.management.base import BaseCommand
-from quiz.bot import run_bot
+
 
 class Command(BaseCommand):
     help = "Запускает Telegram-бот (async)"
 
     def handle(self, *args, **options):
-        run_bot()
+        started_at = time.monotonic()
+        from quiz.bot import run_bot
+        run_bot(started_at)
@@ -0,0 +1,16 @@
+from collections import Counter
+
+counters = Counter()
+gauges = {}
+
+
+def increment(name, value=1):
+    counters[name] += value
+
+
+def set_gauge(name, value):
+    gauges[name] = value
+
+
+def snapshot():
+    return {"counters": dict(counters), "gauges": dict(gauges)}
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.19 on 2026-10-19 02:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContactMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('feedback', 'Обратная связь'), ('guardianship', 'Вопрос об опеке')], max_length=20, verbose_name='Тип сообщения')),
+                ('telegram_user_id', models.BigIntegerField(verbose_name='Telegram User ID')),
+                ('telegram_username', models.CharField(blank=True, max_length=255, verbose_name='Telegram username')),
+                ('text', models.TextField(verbose_name='Текст сообщения')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Получено')),
+                ('forwarded_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Переслано в чат администраторов')),
+                ('is_handled', models.BooleanField(db_index=True, default=False, verbose_name='Обработано')),
+                ('animal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='contact_messages', to='quiz.animal', verbose_name='Тотемное животное')),
+            ],
+            options={
+                'verbose_name': 'Сообщение пользователя',
+                'verbose_name_plural': 'Сообщения пользователей',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
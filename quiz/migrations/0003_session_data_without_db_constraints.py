@@ -0,0 +1,34 @@
+# Generated by Django 4.2.19 on 2026-10-19 02:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0002_contactmessage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contactmessage',
+            name='animal',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='contact_messages', to='quiz.animal', verbose_name='Тотемное животное'),
+        ),
+        migrations.AlterField(
+            model_name='userquizanswer',
+            name='answer',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='quiz.answer', verbose_name='Выбранный ответ'),
+        ),
+        migrations.AlterField(
+            model_name='userquizanswer',
+            name='question',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='quiz.question', verbose_name='Вопрос'),
+        ),
+        migrations.AlterField(
+            model_name='userquizanswer',
+            name='quiz',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='quiz.quiz', verbose_name='Викторина'),
+        ),
+    ]
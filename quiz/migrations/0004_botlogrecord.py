@@ -0,0 +1,61 @@
+# Generated by Django 4.2.19 on 2026-10-19 02:59
+
+from django.db import migrations, models
+
+LOG_SEARCH_SQL = [
+    "CREATE VIRTUAL TABLE quiz_botlogrecord_fts USING fts5(message, content='quiz_botlogrecord', content_rowid='id')",
+    "CREATE TRIGGER quiz_botlogrecord_fts_insert AFTER INSERT ON quiz_botlogrecord BEGIN "
+    "INSERT INTO quiz_botlogrecord_fts(rowid, message) VALUES (new.id, new.message); END",
+    "CREATE TRIGGER quiz_botlogrecord_fts_delete AFTER DELETE ON quiz_botlogrecord BEGIN "
+    "INSERT INTO quiz_botlogrecord_fts(quiz_botlogrecord_fts, rowid, message) VALUES ('delete', old.id, old.message); END",
+    "CREATE TRIGGER quiz_botlogrecord_fts_update AFTER UPDATE ON quiz_botlogrecord BEGIN "
+    "INSERT INTO quiz_botlogrecord_fts(quiz_botlogrecord_fts, rowid, message) VALUES ('delete', old.id, old.message); "
+    "INSERT INTO quiz_botlogrecord_fts(rowid, message) VALUES (new.id, new.message); END",
+]
+DROP_LOG_SEARCH_SQL = [
+    "DROP TRIGGER IF EXISTS quiz_botlogrecord_fts_insert",
+    "DROP TRIGGER IF EXISTS quiz_botlogrecord_fts_delete",
+    "DROP TRIGGER IF EXISTS quiz_botlogrecord_fts_update",
+    "DROP TABLE IF EXISTS quiz_botlogrecord_fts",
+]
+
+
+def create_log_search(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in LOG_SEARCH_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_log_search(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in DROP_LOG_SEARCH_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0003_session_data_without_db_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotLogRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, verbose_name='Время')),
+                ('level', models.PositiveSmallIntegerField(choices=[(10, 'DEBUG'), (20, 'INFO'), (30, 'WARNING'), (40, 'ERROR'), (50, 'CRITICAL')], verbose_name='Уровень')),
+                ('telegram_user_id', models.BigIntegerField(blank=True, null=True, verbose_name='Telegram User ID')),
+                ('quiz_id', models.IntegerField(blank=True, null=True, verbose_name='ID викторины')),
+                ('event', models.CharField(blank=True, max_length=50, verbose_name='Событие')),
+                ('message', models.TextField(verbose_name='Сообщение')),
+            ],
+            options={
+                'verbose_name': 'Запись лога бота',
+                'verbose_name_plural': 'Лог бота',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['telegram_user_id', 'created_at'], name='quiz_botlog_telegra_3a6627_idx'), models.Index(fields=['level', 'created_at'], name='quiz_botlog_level_15ab14_idx'), models.Index(fields=['event', 'created_at'], name='quiz_botlog_event_e31363_idx')],
+            },
+        ),
+        migrations.RunPython(create_log_search, drop_log_search, hints={"model_name": "botlogrecord"}),
+    ]
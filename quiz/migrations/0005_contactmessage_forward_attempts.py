@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-19 03:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0004_botlogrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contactmessage',
+            name='forward_attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Отклонённых попыток пересылки'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import logging
 from django.db import models
 
 
@@ -116,19 +117,134 @@ class UserQuizAnswer(models.Model):
     )
     quiz = models.ForeignKey(
         Quiz,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         verbose_name="Викторина"
     )
     question = models.ForeignKey(
         Question,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         verbose_name="Вопрос"
     )
     answer = models.ForeignKey(
         Answer,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         verbose_name="Выбранный ответ"
     )
 
     def __str__(self):
         return f"Пользователь {self.telegram_user_id}, Викторина {self.quiz}, Вопрос: {self.question}, Ответ: {self.answer}"
+
+
+class ContactMessage(models.Model):
+    FEEDBACK = "feedback"
+    GUARDIANSHIP = "guardianship"
+    KIND_CHOICES = [
+        (FEEDBACK, "Обратная связь"),
+        (GUARDIANSHIP, "Вопрос об опеке"),
+    ]
+
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        verbose_name="Тип сообщения"
+    )
+    telegram_user_id = models.BigIntegerField(
+        verbose_name="Telegram User ID"
+    )
+    telegram_username = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name="Telegram username"
+    )
+    animal = models.ForeignKey(
+        Animal,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="contact_messages",
+        verbose_name="Тотемное животное"
+    )
+    text = models.TextField(
+        verbose_name="Текст сообщения"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Получено"
+    )
+    forwarded_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+        verbose_name="Переслано в чат администраторов"
+    )
+    forward_attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Отклонённых попыток пересылки"
+    )
+    is_handled = models.BooleanField(
+        default=False,
+        db_index=True,
+        verbose_name="Обработано"
+    )
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Сообщение пользователя"
+        verbose_name_plural = "Сообщения пользователей"
+
+    def __str__(self):
+        return f"{self.get_kind_display()} от пользователя {self.telegram_user_id}"
+
+
+class BotLogRecord(models.Model):
+    LEVEL_CHOICES = [
+        (logging.DEBUG, "DEBUG"),
+        (logging.INFO, "INFO"),
+        (logging.WARNING, "WARNING"),
+        (logging.ERROR, "ERROR"),
+        (logging.CRITICAL, "CRITICAL"),
+    ]
+
+    created_at = models.DateTimeField(
+        db_index=True,
+        verbose_name="Время"
+    )
+    level = models.PositiveSmallIntegerField(
+        choices=LEVEL_CHOICES,
+        verbose_name="Уровень"
+    )
+    telegram_user_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Telegram User ID"
+    )
+    quiz_id = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name="ID викторины"
+    )
+    event = models.CharField(
+        max_length=50,
+        blank=True,
+        verbose_name="Событие"
+    )
+    message = models.TextField(
+        verbose_name="Сообщение"
+    )
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["telegram_user_id", "created_at"]),
+            models.Index(fields=["level", "created_at"]),
+            models.Index(fields=["event", "created_at"]),
+        ]
+        verbose_name = "Запись лога бота"
+        verbose_name_plural = "Лог бота"
+
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M:%S} {self.get_level_display()} {self.message[:50]}"
@@ -0,0 +1,150 @@
+import random
+from collections import Counter, defaultdict
+from django.db.models import F
+from django.utils import timezone
+from .cache import bot_cache
+from .models import Quiz, UserQuizAnswer, Question, Answer, Animal, ContactMessage
+
+KEYBOARD_ROW_WIDTH = 2
+
+
+async def get_active_quiz():
+    return await bot_cache.aget_or_set("active_quiz", "current", Quiz.objects.filter(is_active=True).afirst)
+
+
+async def get_quiz(quiz_id):
+    return await bot_cache.aget_or_set("quiz", int(quiz_id), lambda: Quiz.objects.aget(pk=quiz_id))
+
+
+async def get_question(question_id):
+    return await bot_cache.aget_or_set("question", int(question_id), lambda: Question.objects.aget(pk=question_id))
+
+
+async def cleanup_user_answers(user_id, quiz_id):
+    await UserQuizAnswer.objects.filter(telegram_user_id=user_id, quiz_id=quiz_id).adelete()
+
+
+async def get_first_question(quiz):
+    async def load():
+        qq = await quiz.quiz_questions.select_related("question").order_by("order").afirst()
+        return qq.question if qq else None
+
+    return await bot_cache.aget_or_set("first_question", quiz.id, load)
+
+
+def build_keyboard_layout(answers):
+    layout = []
+    for i in range(0, len(answers), KEYBOARD_ROW_WIDTH):
+        layout.append(tuple((ans.text, ans.id) for ans in answers[i:i + KEYBOARD_ROW_WIDTH]))
+    return tuple(layout)
+
+
+async def get_question_keyboard(question):
+    async def load():
+        return build_keyboard_layout([answer async for answer in question.answers.all()])
+
+    return await bot_cache.aget_or_set("keyboard", question.id, load)
+
+
+async def store_user_answer(user_id, quiz_id, question_id, answer_id):
+    # Повтор ответа после сбоя заменяет сохранённый ответ на вопрос, а не добавляет второй.
+    answer, _ = await UserQuizAnswer.objects.aupdate_or_create(
+        telegram_user_id=user_id,
+        quiz_id=quiz_id,
+        question_id=question_id,
+        defaults={"answer_id": answer_id}
+    )
+    return answer
+
+
+async def get_next_question(quiz, question):
+    async def load():
+        current_qq = await quiz.quiz_questions.filter(question=question).afirst()
+        if not current_qq:
+            return None
+        next_qq = await quiz.quiz_questions.filter(order__gt=current_qq.order).select_related("question") \
+            .order_by("order").afirst()
+        return next_qq.question if next_qq else None
+
+    return await bot_cache.aget_or_set("next_question", (quiz.id, question.id), load)
+
+
+async def get_animal_by_id(animal_id):
+    return await bot_cache.aget_or_set("animal", int(animal_id), Animal.objects.filter(id=animal_id).afirst)
+
+
+async def calculate_result(user_id, quiz_id):
+    # prefetch_related() недоступен при асинхронной итерации, поэтому связи ответов с животными
+    # читаются одним запросом к промежуточной таблице.
+    answer_counts = Counter([
+        answer_id async for answer_id in UserQuizAnswer.objects.filter(telegram_user_id=user_id, quiz_id=quiz_id)
+        .values_list("answer_id", flat=True)
+    ])
+    if not answer_counts:
+        return None
+
+    counts = defaultdict(int)
+    async for answer_id, animal_id in Answer.animals.through.objects.filter(answer_id__in=answer_counts) \
+            .values_list("answer_id", "animal_id"):
+        counts[animal_id] += answer_counts[answer_id]
+
+    if not counts:
+        return None
+
+    max_count = max(counts.values())
+    max_ids: list[int] = [aid for aid, cnt in counts.items() if cnt == max_count]
+    chosen_id = random.choice(max_ids)
+    return await get_animal_by_id(chosen_id)
+
+
+async def save_contact_message(kind, user, text, animal_id=None):
+    return await ContactMessage.objects.acreate(
+        kind=kind,
+        telegram_user_id=user.id,
+        telegram_username=user.username or "",
+        animal_id=animal_id,
+        text=text
+    )
+
+
+async def get_pending_contact_messages(limit, max_attempts):
+    messages = [message async for message in ContactMessage.objects
+                .filter(forwarded_at__isnull=True, forward_attempts__lt=max_attempts).order_by("created_at")[:limit]]
+    animal_ids = {message.animal_id for message in messages if message.animal_id is not None}
+    animals = {animal.id: animal async for animal in Animal.objects.filter(pk__in=animal_ids)} if animal_ids else {}
+    for message in messages:
+        if message.animal_id is not None:
+            message.animal = animals.get(message.animal_id)
+    return messages
+
+
+async def mark_contact_messages_forwarded(message_ids):
+    await ContactMessage.objects.filter(pk__in=message_ids).aupdate(forwarded_at=timezone.now())
+
+
+async def record_contact_forward_failure(message_id):
+    await ContactMessage.objects.filter(pk=message_id).aupdate(forward_attempts=F("forward_attempts") + 1)
+
+
+async def warm_up_caches():
+    quiz = await Quiz.objects.filter(is_active=True).afirst()
+    await bot_cache.aset("active_quiz", "current", quiz)
+    if quiz is None:
+        return None, 0, 0
+    await bot_cache.aset("quiz", quiz.id, quiz)
+
+    questions = [qq.question async for qq in quiz.quiz_questions.select_related("question").order_by("order")]
+    await bot_cache.aset("first_question", quiz.id, questions[0] if questions else None)
+
+    answers_by_question = {question.id: [] for question in questions}
+    async for answer in Answer.objects.filter(question__in=questions).order_by("pk"):
+        answers_by_question[answer.question_id].append(answer)
+    for question, next_question in zip(questions, questions[1:] + [None]):
+        await bot_cache.aset("question", question.id, question)
+        await bot_cache.aset("keyboard", question.id, build_keyboard_layout(answers_by_question[question.id]))
+        await bot_cache.aset("next_question", (quiz.id, question.id), next_question)
+
+    animals = [animal async for animal in Animal.objects.all()]
+    for animal in animals:
+        await bot_cache.aset("animal", animal.id, animal)
+    return quiz, len(questions), len(animals)
@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .analysis import BALANCE_CACHE_FAMILY
+from .cache import bot_cache
+from .models import Quiz, QuizQuestion, Question, Answer, Animal
+
+INVALIDATED_FAMILIES = {
+    Quiz: ("active_quiz", "quiz", "first_question", "next_question", BALANCE_CACHE_FAMILY),
+    QuizQuestion: ("first_question", "next_question", BALANCE_CACHE_FAMILY),
+    Question: ("question", "first_question", "next_question", "keyboard", BALANCE_CACHE_FAMILY),
+    Answer: ("keyboard", BALANCE_CACHE_FAMILY),
+    Animal: ("animal", BALANCE_CACHE_FAMILY),
+    Answer.animals.through: (BALANCE_CACHE_FAMILY,),
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_quiz_content(sender, **kwargs):
+    for family in INVALIDATED_FAMILIES.get(sender, ()):
+        bot_cache.invalidate(family)
+
+
+@receiver(m2m_changed, sender=Answer.animals.through)
+def invalidate_answer_animals(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_quiz_content(sender)
@@ -1,3 +1,429 @@
-from django.test import TestCase
+import base64
+import itertools
+import json
+import random
+import tempfile
+from collections import Counter
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, override_settings
+from telegram.error import BadRequest
+from .callback_data import CODEC_VERSION, START_QUIZ, QUIZ_ANSWER, CONTACT_GUARDIANSHIP, MAX_CALLBACK_DATA_LENGTH, \
+    encode_callback_data, decode_callback_data, callback_tag_pattern
+from .analysis import count_result_paths
+from .cache import TwoTierCache, bot_cache
+from .db_routers import SessionDataRouter
+from .load_shedding import LoadMonitor, NORMAL, SOFT, HARD
+from .management.commands.benchmark_data_access import legacy_calculate_result
+from .models import Animal, Answer, BotLogRecord, ContactMessage, Question, Quiz, QuizQuestion, UserQuizAnswer
+from .repository import calculate_result, store_user_answer
+from .user_state import UserStateTracker
+from .update_recorder import UpdateRecorder
 
-# Create your tests here.
+# Без этого импорт бота запустил бы поток DatabaseLogHandler, пишущий в рабочую базу.
+with override_settings(BOT_LOG_STORE={"ENABLED": False}):
+    from . import bot
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests"}}
+BOT_LOCMEM_CACHES = dict(LOCMEM_CACHES, bot_cache_versions={
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests-versions"})
+
+
+class CallbackDataTests(SimpleTestCase):
+    def test_round_trip(self):
+        for tag, fields in [
+            (START_QUIZ, ()),
+            (CONTACT_GUARDIANSHIP, (0,)),
+            (QUIZ_ANSWER, (1, 12, 345, 0, 0)),
+            (QUIZ_ANSWER, (127, 128, 16383, 16384, 2 ** 16 - 1)),
+            (QUIZ_ANSWER, (2 ** 31, 2 ** 40, 2 ** 50)),
+        ]:
+            with self.subTest(tag=tag, fields=fields):
+                data = encode_callback_data(tag, *fields)
+                self.assertLessEqual(len(data), MAX_CALLBACK_DATA_LENGTH)
+                self.assertNotIn("=", data)
+                self.assertEqual(decode_callback_data(data), (tag, fields))
+
+    def test_encode_rejects_negative_and_oversized_values(self):
+        with self.assertRaises(ValueError):
+            encode_callback_data(QUIZ_ANSWER, 1, -1, 2)
+        with self.assertRaises(ValueError):
+            encode_callback_data(QUIZ_ANSWER, *([2 ** 60] * 6))
+
+    def test_legacy_formats(self):
+        self.assertEqual(decode_callback_data("start_quiz"), (START_QUIZ, ()))
+        self.assertEqual(decode_callback_data("quiz:3|17|42"), (QUIZ_ANSWER, (3, 17, 42)))
+        self.assertEqual(decode_callback_data("contact_guardianship:9"), (CONTACT_GUARDIANSHIP, (9,)))
+
+    def test_invalid_data(self):
+        truncated = base64.urlsafe_b64encode(bytes((CODEC_VERSION, QUIZ_ANSWER, 0x81))).rstrip(b"=").decode()
+        other_version = base64.urlsafe_b64encode(bytes((CODEC_VERSION + 1, QUIZ_ANSWER, 1))).rstrip(b"=").decode()
+        for data in ["", None, "garbage!!", "quiz:1|x|3", "contact_guardianship:", "AQ", truncated, other_version]:
+            with self.subTest(data=data):
+                self.assertIsNone(decode_callback_data(data))
+
+    def test_tag_pattern(self):
+        pattern = callback_tag_pattern(CONTACT_GUARDIANSHIP)
+        self.assertTrue(pattern(encode_callback_data(CONTACT_GUARDIANSHIP, 5)))
+        self.assertTrue(pattern("contact_guardianship:5"))
+        self.assertFalse(pattern(encode_callback_data(START_QUIZ)))
+        self.assertFalse(pattern("garbage!!"))
+        self.assertFalse(pattern(None))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        TwoTierCache().backend.clear()
+
+    def test_get_or_set_loads_once_and_caches_none(self):
+        cache = TwoTierCache()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return None
+
+        self.assertIsNone(cache.get_or_set("family", 1, loader))
+        self.assertIsNone(cache.get_or_set("family", 1, loader))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()["family"]["l1_hits"], 1)
+
+    def test_l1_evicts_least_recently_used(self):
+        cache = TwoTierCache(l1_max_entries=2)
+        for key in (1, 2):
+            cache.set("family", key, key)
+        cache.get("family", 1)
+        cache.set("family", 3, 3)
+        self.assertEqual([cache.get("family", key) for key in (1, 3, 2)], [1, 3, 2])
+        self.assertEqual(cache.stats()["family"], {"l1_hits": 3, "l2_hits": 1, "misses": 0, "hit_rate": 1.0})
+
+    def test_invalidate_is_seen_by_other_processes(self):
+        writer = TwoTierCache(version_check_interval=0)
+        reader = TwoTierCache(version_check_interval=0)
+        writer.set("family", "key", "old")
+        self.assertEqual(reader.get("family", "key"), "old")
+        writer.invalidate("family")
+        self.assertIsNone(reader.get("family", "key"))
+        self.assertEqual(reader.get_or_set("family", "key", lambda: "new"), "new")
+        self.assertEqual(writer.get("family", "key"), "new")
+
+    def test_stale_version_is_kept_until_check_interval(self):
+        writer = TwoTierCache()
+        reader = TwoTierCache(version_check_interval=3600)
+        reader.set("family", "key", "old")
+        writer.invalidate("family")
+        self.assertEqual(reader.get("family", "key"), "old")
+
+    def test_l2_only_entry_is_replaced_without_bumping_version(self):
+        writer = TwoTierCache(version_check_interval=3600)
+        reader = TwoTierCache(version_check_interval=3600)
+        writer.set("family", "other", "kept")
+        writer.set("family", "key", "old", l1=False)
+        self.assertEqual(reader.get("family", "key", l1=False), "old")
+        writer.set("family", "key", "new", l1=False)
+        self.assertEqual(reader.get("family", "key", l1=False), "new")
+        self.assertEqual(reader.get("family", "other"), "kept")
+        self.assertEqual(reader.stats()["family"]["l1_hits"], 0)
+
+    @override_settings(CACHES=dict(LOCMEM_CACHES, versions={
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "test-versions"}))
+    def test_versions_survive_clearing_entries(self):
+        cache = TwoTierCache(version_check_interval=0, version_alias="versions")
+        cache.versions.clear()
+        cache.set("family", "key", "old")
+        stale_entry = cache.backend.get("family:key", version=1)
+        cache.invalidate("family")
+        cache.backend.clear()
+        cache.backend.set("family:key", stale_entry, version=1)
+        self.assertIsNone(TwoTierCache(version_alias="versions").get("family", "key"))
+
+    async def test_async_methods_share_entries(self):
+        cache = TwoTierCache()
+
+        async def loader():
+            return "value"
+
+        self.assertEqual(await cache.aget_or_set("family", "key", loader), "value")
+        self.assertEqual(cache.get("family", "key"), "value")
+        await cache.aset("family", "key", "other")
+        self.assertEqual(await cache.aget("family", "key"), "other")
+
+
+class LoadMonitorTests(SimpleTestCase):
+    def test_level_follows_queue_depth(self):
+        monitor = LoadMonitor(soft_queue_depth=5, hard_queue_depth=10)
+        self.assertEqual([monitor.update_level(depth) for depth in (0, 5, 10, 9, 4)], [NORMAL, SOFT, HARD, SOFT, NORMAL])
+        self.assertEqual(monitor.queue_depth, 4)
+        self.assertFalse(monitor.overloaded)
+
+    def test_level_follows_smoothed_latency_within_window(self):
+        monitor = LoadMonitor(soft_latency=1.0, hard_latency=3.0, latency_window=10.0, smoothing=0.5)
+        with mock.patch("quiz.load_shedding.time.monotonic", return_value=100.0):
+            monitor.record_latency(4.0)
+            self.assertEqual(monitor.update_level(0), SOFT)
+            monitor.record_latency(4.0)
+            self.assertEqual(monitor.update_level(0), HARD)
+            monitor.record_latency(0.0)
+            self.assertEqual(monitor.update_level(0), SOFT)
+        with mock.patch("quiz.load_shedding.time.monotonic", return_value=111.0):
+            self.assertEqual(monitor.current_latency(), 0.0)
+            self.assertEqual(monitor.update_level(0), NORMAL)
+
+    def test_level_for_does_not_change_level(self):
+        monitor = LoadMonitor(soft_queue_depth=5, hard_queue_depth=10)
+        monitor.update_level(7)
+        self.assertEqual(monitor.level_for(0), NORMAL)
+        self.assertEqual(monitor.level_for(20), HARD)
+        self.assertEqual((monitor.level, monitor.queue_depth), (SOFT, 7))
+        self.assertTrue(monitor.overloaded)
+
+
+class UserStateTrackerTests(SimpleTestCase):
+    def touch_at(self, tracker, moment, *user_ids):
+        with mock.patch("quiz.user_state.time.monotonic", return_value=moment):
+            for user_id in user_ids:
+                tracker.touch(user_id)
+
+    def select_at(self, tracker, moment, protected=()):
+        with mock.patch("quiz.user_state.time.monotonic", return_value=moment):
+            return tracker.select_evictions(protected)
+
+    def test_evicts_least_recently_seen_over_limit(self):
+        tracker = UserStateTracker(max_users=2, idle_timeout=3600)
+        self.touch_at(tracker, 0, 1, 2, 3, 4)
+        self.touch_at(tracker, 1, 1)
+        self.assertEqual(self.select_at(tracker, 2), [2, 3])
+
+    def test_evicts_idle_users(self):
+        tracker = UserStateTracker(max_users=10, idle_timeout=60)
+        self.touch_at(tracker, 0, 1, 2)
+        self.touch_at(tracker, 50, 3)
+        self.assertEqual(self.select_at(tracker, 59), [])
+        self.assertEqual(self.select_at(tracker, 60), [1, 2])
+
+    def test_protected_users_are_kept_and_do_not_count_as_evicted(self):
+        tracker = UserStateTracker(max_users=2, idle_timeout=3600)
+        self.touch_at(tracker, 0, 1, 2, 3, 4)
+        self.assertEqual(self.select_at(tracker, 1, protected={1}), [2, 3])
+        tracker.forget(2)
+        tracker.forget(3)
+        self.assertEqual(len(tracker), 2)
+        self.assertEqual(self.select_at(tracker, 1), [])
+
+
+class UpdateRecorderAnonymizeTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.recorder = UpdateRecorder(f"{directory.name}/updates.jsonl", salt="test")
+        for handler in self.recorder.logger.handlers:
+            self.addCleanup(handler.close)
+            self.addCleanup(self.recorder.logger.removeHandler, handler)
+
+    @staticmethod
+    def user(user_id, name="Иван"):
+        return {"id": user_id, "is_bot": False, "first_name": name, "last_name": "Петров", "username": f"user{user_id}"}
+
+    def test_forwarded_message_has_no_personal_data(self):
+        message = {
+            "message_id": 5,
+            "from": self.user(7000000001),
+            "chat": {"id": 7000000001, "type": "private", "first_name": "Иван", "username": "user7000000001"},
+            "forward_origin": {"type": "user", "date": 0, "sender_user": self.user(7000000002)},
+            "forward_from": self.user(7000000002),
+            "via_bot": {"id": 7000000003, "is_bot": True, "first_name": "Бот", "username": "user7000000003"},
+            "new_chat_members": [self.user(7000000004), self.user(7000000005)],
+            "left_chat_member": self.user(7000000006),
+            "contact": {"phone_number": "+79990000000", "first_name": "Иван", "user_id": 7000000007},
+            "reply_to_message": {
+                "message_id": 4,
+                "forward_origin": {"type": "hidden_user", "date": 0, "sender_user_name": "Скрытый Иван"},
+                "entities": [{"type": "text_mention", "offset": 0, "length": 4, "user": self.user(7000000008)}],
+            },
+            "text": "привет",
+        }
+        anonymized = self.recorder.anonymize({"update_id": 7, "message": message})
+        dumped = json.dumps(anonymized, ensure_ascii=False)
+        for user_id in range(7000000001, 7000000009):
+            self.assertNotIn(str(user_id), dumped)
+        for value in ("Иван", "Петров", "+79990000000"):
+            self.assertNotIn(value, dumped)
+        self.assertEqual(anonymized["message"]["from"]["id"], anonymized["message"]["chat"]["id"])
+        self.assertEqual(anonymized["message"]["forward_origin"]["sender_user"]["id"],
+                         anonymized["message"]["forward_from"]["id"])
+        self.assertEqual(anonymized["message"]["contact"]["user_id"], self.recorder.anonymize_id(7000000007))
+        self.assertEqual((anonymized["update_id"], anonymized["message"]["message_id"], anonymized["message"]["text"]),
+                         (7, 5, "привет"))
+
+    def test_group_chat_id_keeps_sign(self):
+        chat = {"id": -1001234567890, "type": "supergroup", "title": "Зоопарк"}
+        anonymized = self.recorder.anonymize({"chat": chat})
+        self.assertLess(anonymized["chat"]["id"], 0)
+        self.assertNotEqual(anonymized["chat"]["id"], -1001234567890)
+
+
+class CountResultPathsTests(SimpleTestCase):
+    @staticmethod
+    def brute_force(answer_sets_per_question, animal_ids):
+        outcomes = Counter()
+        for combination in itertools.product(*answer_sets_per_question):
+            counts = Counter(animal_id for animals in combination for animal_id in animals)
+            if not counts:
+                outcomes[None] += 1
+                continue
+            best = max(counts.values())
+            outcomes[frozenset(animal_id for animal_id in animal_ids if counts[animal_id] == best)] += 1
+        return outcomes
+
+    @staticmethod
+    def dynamic(answer_sets_per_question, animal_ids):
+        states, index = count_result_paths(answer_sets_per_question, animal_ids)
+        outcomes = Counter()
+        for (deficits, counted), paths in states.items():
+            winners = frozenset(animal_id for animal_id in animal_ids if deficits[index[animal_id]] == 0)
+            outcomes[winners if counted else None] += paths
+        return outcomes
+
+    def test_matches_brute_force_on_random_quizzes(self):
+        rng = random.Random(37)
+        for attempt in range(300):
+            animal_ids = rng.sample(range(1, 50), rng.randint(1, 6))
+            answer_sets_per_question = [
+                [frozenset(animal_id for animal_id in animal_ids if rng.random() < 0.35)
+                 for _ in range(rng.randint(1, 4))]
+                for _ in range(rng.randint(1, 6))
+            ]
+            with self.subTest(attempt=attempt):
+                self.assertEqual(self.dynamic(answer_sets_per_question, animal_ids),
+                                 self.brute_force(answer_sets_per_question, animal_ids))
+
+
+class ContactForwardingTests(SimpleTestCase):
+    @staticmethod
+    def message(message_id, text):
+        return ContactMessage(id=message_id, kind=ContactMessage.FEEDBACK, telegram_user_id=message_id, text=text)
+
+    def test_escape_truncated_does_not_cut_entities(self):
+        self.assertEqual(bot.escape_truncated("a<b", 10), "a&lt;b")
+        self.assertEqual(bot.escape_truncated("<" * 5000, 10), "&lt;" * 2 + "…")
+        self.assertEqual(bot.escape_truncated("ab&cd", 5), "ab…")
+
+    def test_single_message_fits_telegram_limit(self):
+        text = bot.format_contact_message(self.message(1, "<&>" * 3000))
+        self.assertLessEqual(len(text), bot.ADMIN_MESSAGE_MAX_LENGTH)
+        self.assertTrue(text.endswith("&gt;…") or text.endswith("&amp;…") or text.endswith("&lt;…"))
+
+    def test_digests_split_on_limit(self):
+        messages = [self.message(message_id, "x" * 1500) for message_id in range(1, 6)]
+        messages.append(self.message(6, "<" * 5000))
+        digests = bot.build_digests(messages)
+        self.assertEqual([ids for _, ids in digests], [[1, 2], [3, 4], [5], [6]])
+        for text, _ in digests:
+            self.assertLessEqual(len(text), bot.ADMIN_MESSAGE_MAX_LENGTH)
+
+    @override_settings(ADMIN_CHAT_ID="1", CONTACT_FORWARDING={
+        "MODE": "digest", "DIGEST_INTERVAL": 600, "RETRY_INTERVAL": 60, "BATCH_SIZE": 50, "MAX_ATTEMPTS": 5})
+    async def test_rejected_digest_falls_back_to_single_messages(self):
+        messages = [self.message(1, "first"), self.message(2, "poison"), self.message(3, "third")]
+
+        async def send_message(chat_id, text, parse_mode):
+            if "poison" in text:
+                raise BadRequest("Can't parse entities")
+
+        context = mock.Mock(bot_data={})
+        context.bot.send_message = mock.AsyncMock(side_effect=send_message)
+        context.application.update_queue.qsize.return_value = 0
+        with mock.patch.object(bot, "get_pending_contact_messages", mock.AsyncMock(return_value=messages)), \
+                mock.patch.object(bot, "mark_contact_messages_forwarded", mock.AsyncMock()) as mark_forwarded, \
+                mock.patch.object(bot, "record_contact_forward_failure", mock.AsyncMock()) as record_failure, \
+                mock.patch.object(bot.logger, "log_error"):
+            await bot.forward_contact_messages(context)
+        self.assertEqual(context.bot.send_message.await_count, 4)
+        self.assertEqual([call.args for call in mark_forwarded.await_args_list], [([1],), ([3],)])
+        record_failure.assert_awaited_once_with(2)
+
+
+class SessionDataRouterTests(SimpleTestCase):
+    def test_models_are_routed_by_churn(self):
+        router = SessionDataRouter()
+        for model, database in [(Quiz, "default"), (Answer, "default"), (Answer.animals.through, "default"),
+                                (UserQuizAnswer, "sessions"), (ContactMessage, "sessions"),
+                                (BotLogRecord, "logs")]:
+            with self.subTest(model=model.__name__):
+                self.assertEqual(router.db_for_read(model), database)
+                self.assertEqual(router.db_for_write(model), database)
+
+    def test_migrations_run_only_in_own_database(self):
+        router = SessionDataRouter()
+        for app_label, model_name, database in [("quiz", "quiz", "default"), ("auth", "user", "default"),
+                                                ("quiz", "userquizanswer", "sessions"),
+                                                ("sessions", "session", "sessions"),
+                                                ("django_cache", None, "sessions"),
+                                                ("quiz", "botlogrecord", "logs")]:
+            for db in ("default", "sessions", "logs"):
+                with self.subTest(app_label=app_label, model_name=model_name, db=db):
+                    self.assertEqual(router.allow_migrate(db, app_label, model_name), db == database)
+
+
+@override_settings(CACHES=BOT_LOCMEM_CACHES)
+class CalculateResultTests(TestCase):
+    databases = {"default", "sessions"}
+    user_id = 101
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.animals = [Animal.objects.create(name=name, page_url="https://example.com/", image_url="https://example.com/")
+                       for name in ("Лев", "Бобр", "Сова")]
+        lion, beaver, owl = cls.animals
+        cls.quiz = Quiz.objects.create(name="Тест", is_active=True)
+        cls.questions = [Question.objects.create(text=f"Вопрос {order}") for order in range(3)]
+        for order, question in enumerate(cls.questions):
+            QuizQuestion.objects.create(quiz=cls.quiz, question=question, order=order)
+        cls.answers = {}
+        for question, name, animals in [(0, "a1", [lion]), (0, "a2", [lion, beaver]),
+                                        (1, "b1", [beaver]), (1, "b2", [owl]),
+                                        (2, "c1", [lion, owl]), (2, "c2", [])]:
+            answer = Answer.objects.create(text=name, question=cls.questions[question])
+            answer.animals.set(animals)
+            cls.answers[name] = answer
+
+    def setUp(self):
+        bot_cache.invalidate("animal")
+
+    async def answer(self, *names):
+        await UserQuizAnswer.objects.filter(telegram_user_id=self.user_id).adelete()
+        for name in names:
+            answer = self.answers[name]
+            await store_user_answer(self.user_id, self.quiz.id, answer.question_id, answer.id)
+
+    async def candidates(self, calculate):
+        chosen = []
+
+        def choice(ids):
+            chosen.append(sorted(ids))
+            return min(ids)
+
+        with mock.patch("random.choice", side_effect=choice):
+            animal = await calculate(self.user_id, self.quiz.id)
+        return (animal.id if animal else None), chosen
+
+    async def test_matches_legacy_counts_and_ties(self):
+        lion, beaver, owl = self.animals
+        for names, expected in [(("a2", "b1", "c2"), [[beaver.id]]),
+                                (("a1", "b2", "c1"), [sorted([lion.id, owl.id])]),
+                                (("a1", "b1", "c1"), [[lion.id]]),
+                                (("c2",), []),
+                                ((), [])]:
+            with self.subTest(answers=names):
+                await self.answer(*names)
+                result = await self.candidates(calculate_result)
+                self.assertEqual(result, await self.candidates(legacy_calculate_result))
+                self.assertEqual(result[1], expected)
+
+    async def test_repeated_answer_replaces_stored_one(self):
+        answer = self.answers
+        await store_user_answer(self.user_id, self.quiz.id, answer["a1"].question_id, answer["a1"].id)
+        await store_user_answer(self.user_id, self.quiz.id, answer["a2"].question_id, answer["a2"].id)
+        stored = [row async for row in UserQuizAnswer.objects.filter(telegram_user_id=self.user_id)
+                  .values_list("question_id", "answer_id")]
+        self.assertEqual(stored, [(answer["a2"].question_id, answer["a2"].id)])
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import logging
+import time
+from logging.handlers import RotatingFileHandler
+from django.conf import settings
+
+ANONYMIZED_ID_FIELDS = ("id", "user_id")
+DROPPED_FIELDS = ("username", "last_name", "bio")
+REDACTED_FIELDS = {"first_name": "user", "phone_number": "0", "sender_user_name": "user", "forward_sender_name": "user"}
+
+
+def is_personal_object(data):
+    # Пользователи и чаты распознаются по структуре, а не по имени поля, в котором они лежат:
+    # они встречаются в forward_origin, new_chat_members, via_bot, reply_to_message и других местах.
+    if "phone_number" in data:
+        return True
+    return isinstance(data.get("id"), int) and ("first_name" in data or "is_bot" in data or "type" in data)
+
+
+class UpdateRecorder:
+    def __init__(self, record_file, max_bytes=5e7, backup_count=5, salt=""):
+        self.salt = salt
+        self.logger = logging.getLogger("update_recorder")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        file_handler = RotatingFileHandler(record_file, maxBytes=max_bytes, backupCount=backup_count,
+                                           encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger.addHandler(file_handler)
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, "BOT_UPDATE_RECORDING", {})
+        if not options.get("FILE"):
+            return None
+        return cls(
+            options["FILE"],
+            max_bytes=options.get("MAX_BYTES", 5e7),
+            backup_count=options.get("BACKUP_COUNT", 5),
+            salt=options.get("SALT", ""),
+        )
+
+    def anonymize_id(self, value):
+        digest = hashlib.blake2b(f"{self.salt}:{abs(value)}".encode(), digest_size=6).digest()
+        anonymized = int.from_bytes(digest, "big")
+        return -anonymized if value < 0 else anonymized
+
+    def anonymize(self, data):
+        if isinstance(data, list):
+            return [self.anonymize(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+        personal = is_personal_object(data)
+        result = {}
+        for key, value in data.items():
+            if key in DROPPED_FIELDS:
+                continue
+            if key in REDACTED_FIELDS:
+                value = REDACTED_FIELDS[key]
+            elif personal and key in ANONYMIZED_ID_FIELDS and isinstance(value, int):
+                value = self.anonymize_id(value)
+            result[key] = self.anonymize(value)
+        return result
+
+    def record(self, update_data):
+        line = json.dumps({"ts": time.time(), "update": self.anonymize(update_data)}, ensure_ascii=False)
+        self.logger.info(line)
+
+    def flush(self):
+        for handler in self.logger.handlers:
+            handler.flush()
+
+
+def read_recordings(paths):
+    for path in paths:
+        with open(path, encoding="utf-8") as record_file:
+            for line in record_file:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
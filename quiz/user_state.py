@@ -0,0 +1,77 @@
+import os
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+
+SPILL_KEY_PREFIX = "user_state"
+
+
+class UserStateTracker:
+    """
+    Порядок последней активности пользователей (LRU) для вытеснения их user_data
+    из памяти процесса: по простою дольше idle_timeout и сверх max_users.
+    """
+
+    def __init__(self, max_users=10000, idle_timeout=3600):
+        self.max_users = max_users
+        self.idle_timeout = idle_timeout
+        self._last_seen = OrderedDict()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, "BOT_USER_STATE", {})
+        return cls(
+            max_users=options.get("MAX_USERS", 10000),
+            idle_timeout=options.get("IDLE_TIMEOUT", 3600),
+        )
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def touch(self, user_id):
+        self._last_seen[user_id] = time.monotonic()
+        self._last_seen.move_to_end(user_id)
+
+    def last_seen(self, user_id):
+        return self._last_seen.get(user_id)
+
+    def forget(self, user_id):
+        self._last_seen.pop(user_id, None)
+
+    def select_evictions(self, protected=()):
+        now = time.monotonic()
+        overflow = len(self._last_seen) - self.max_users
+        evictions = []
+        for user_id, last_seen in self._last_seen.items():
+            if overflow <= 0 and now - last_seen < self.idle_timeout:
+                break
+            if user_id in protected:
+                continue
+            evictions.append(user_id)
+            overflow -= 1
+        return evictions
+
+
+def spill_key(user_id):
+    return f"{SPILL_KEY_PREFIX}:{user_id}"
+
+
+def spill_cache():
+    return caches[getattr(settings, "BOT_USER_STATE", {}).get("CACHE_ALIAS", "default")]
+
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+user_state_tracker = UserStateTracker.from_settings()
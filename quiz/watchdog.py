@@ -0,0 +1,174 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.conf import settings
+from telegram.request import HTTPXRequest
+from . import metrics
+
+
+class LoopWatchdog:
+    """
+    Следит за циклом событий бота: задержку цикла меряет периодическая задача, а отдельный поток
+    замечает остановку цикла и записывает в лог стек потока цикла. Также хранит время последнего
+    обработанного обновления и последнего успешного вызова Bot API для проверок живости и готовности.
+    """
+
+    def __init__(self, interval=1.0, stall_threshold=5.0, liveness_timeout=30.0, ready_max_loop_lag=1.0,
+                 ready_max_api_silence=60.0, health_host="127.0.0.1", health_port=None):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.liveness_timeout = liveness_timeout
+        self.ready_max_loop_lag = ready_max_loop_lag
+        self.ready_max_api_silence = ready_max_api_silence
+        self.health_host = health_host
+        self.health_port = health_port
+        self.heartbeat_at = None
+        self.loop_lag = 0.0
+        self.last_update_at = None
+        self.last_api_call_at = None
+        self.stopping = False
+        self._logger = None
+        self._loop_thread_id = None
+        self._heartbeat_task = None
+        self._monitor_thread = None
+        self._monitor_stop = threading.Event()
+        self._server = None
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, "BOT_WATCHDOG", {})
+        return cls(
+            interval=options.get("INTERVAL", 1.0),
+            stall_threshold=options.get("STALL_THRESHOLD", 5.0),
+            liveness_timeout=options.get("LIVENESS_TIMEOUT", 30.0),
+            ready_max_loop_lag=options.get("READY_MAX_LOOP_LAG", 1.0),
+            ready_max_api_silence=options.get("READY_MAX_API_SILENCE", 60.0),
+            health_host=options.get("HEALTH_HOST", "127.0.0.1"),
+            health_port=options.get("HEALTH_PORT"),
+        )
+
+    def mark_update(self):
+        self.last_update_at = time.monotonic()
+
+    def mark_api_call(self):
+        self.last_api_call_at = time.monotonic()
+
+    def start(self, logger):
+        self._logger = logger
+        self._loop_thread_id = threading.get_ident()
+        self.heartbeat_at = time.monotonic()
+        self.stopping = False
+        self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat(), name="watchdog_heartbeat")
+        self._monitor_stop.clear()
+        self._monitor_thread = threading.Thread(target=self._monitor, name="watchdog_monitor", daemon=True)
+        self._monitor_thread.start()
+        if self.health_port is not None:
+            self._server = ThreadingHTTPServer((self.health_host, self.health_port), HealthRequestHandler)
+            self._server.watchdog = self
+            threading.Thread(target=self._server.serve_forever, name="health_server", daemon=True).start()
+            logger.log_info(f"Проверка состояния доступна на http://{self.health_host}:{self.health_port}"
+                            f"/healthz, /readyz и /metrics")
+
+    def stop(self):
+        self.stopping = True
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        self._monitor_stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    async def _heartbeat(self):
+        while True:
+            expected_at = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.loop_lag = max(0.0, now - expected_at)
+            self.heartbeat_at = now
+            metrics.set_gauge("loop_lag", round(self.loop_lag, 4))
+            if self.loop_lag >= self.stall_threshold:
+                metrics.increment("loop_stalls")
+                self._logger.log_error(f"Цикл событий был заблокирован {self.loop_lag:.2f} с")
+
+    def _monitor(self):
+        dumped_for = None
+        while not self._monitor_stop.wait(self.interval):
+            heartbeat_at = self.heartbeat_at
+            if time.monotonic() - heartbeat_at < self.stall_threshold or dumped_for == heartbeat_at:
+                continue
+            dumped_for = heartbeat_at
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "стек недоступен"
+            self._logger.log_error(f"Цикл событий не отвечает {time.monotonic() - heartbeat_at:.2f} с, "
+                                   f"стек потока цикла:\n{stack}")
+
+    def status(self):
+        now = time.monotonic()
+
+        def age(moment):
+            return None if moment is None else round(now - moment, 3)
+
+        return {
+            "loop_lag": round(self.loop_lag, 4),
+            "heartbeat_age": age(self.heartbeat_at),
+            "last_update_age": age(self.last_update_at),
+            "last_api_call_age": age(self.last_api_call_at),
+            "stopping": self.stopping,
+        }
+
+    def is_alive(self):
+        return self.heartbeat_at is not None and time.monotonic() - self.heartbeat_at < self.liveness_timeout
+
+    def is_ready(self):
+        now = time.monotonic()
+        if self.stopping or self.heartbeat_at is None or self.last_api_call_at is None:
+            return False
+        return (self.loop_lag <= self.ready_max_loop_lag
+                and now - self.heartbeat_at <= self.interval + self.ready_max_loop_lag
+                and now - self.last_api_call_at < self.ready_max_api_silence)
+
+
+class HealthRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        watchdog = self.server.watchdog
+        if self.path == "/healthz":
+            ok = watchdog.is_alive()
+        elif self.path == "/readyz":
+            ok = watchdog.is_ready()
+        elif self.path == "/metrics":
+            self.send_json(200, metrics.snapshot())
+            return
+        else:
+            self.send_error(404)
+            return
+        self.send_json(200 if ok else 503, dict(watchdog.status(), ok=ok))
+
+    def send_json(self, code, data):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WatchedRequest(HTTPXRequest):
+    """HTTPXRequest, отмечающий в watchdog каждый успешный ответ Bot API."""
+
+    async def do_request(self, *args, **kwargs):
+        code, payload = await super().do_request(*args, **kwargs)
+        if 200 <= code < 300:
+            watchdog.mark_api_call()
+        return code, payload
+
+
+watchdog = LoopWatchdog.from_settings()